@@ -1,12 +1,46 @@
 # citation_manager.py
 
 import re
+from functools import lru_cache
 from typing import List, Tuple
 from langchain_core.documents import Document
 
 from citation_models import Citation, RenumberedCitation, ProcessedLLMResponse
 from citation_utils import strip_html_tags # Assuming you have this helper
 
+SOURCE_CITATION_RE = re.compile(r'\[Source (\d+)\]')
+DOCUMENT_CITATION_RE = re.compile(r'\[(\d+)\]')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Known document extensions, stripped in one pass to get a file's base name
+DOCUMENT_EXTENSION_RE = re.compile(r'\.(?:pdf|txt|docx)')
+
+# Filename-independent trailing metadata, applied in order after the filename patterns
+TRAILING_METADATA_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    # Remove trailing numbers that might be page numbers or file references
+    r'\s*\d{3,4}\s*$',  # Remove 3-4 digit numbers at end
+    # Remove common document footers
+    r'\s*Page \d+.*$',
+    r'\s*p\.\s*\d+.*$',
+    r'\s*\d+/\d+\s*$',  # Page numbers like "1/10"
+    # Remove trailing whitespace and cleanup
+    r'\s+$'
+))
+
+@lru_cache(maxsize=128)
+def _filename_patterns(filename: str) -> Tuple[re.Pattern, ...]:
+    """Compile the filename-specific trailing patterns once per document."""
+    # Remove file extension and get base name
+    base_filename = DOCUMENT_EXTENSION_RE.sub('', filename)
+    
+    return tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+        # Exact filename matches at end of content
+        rf'\s*{re.escape(filename)}\s*$',
+        rf'\s*{re.escape(base_filename)}\s*$',
+        # Common patterns with numbers (like "effective headline 1311")
+        rf'\s*{re.escape(base_filename)}\s*\d+\s*$',
+    ))
+
 class CitationManager:
     """
     Manages the creation, formatting, and processing of citations for the RAG pipeline.
@@ -22,21 +56,19 @@ class CitationManager:
         for i, (doc, score) in enumerate(search_results, 1):
             source_id = doc.metadata.get("id", "Unknown")
             source_parts = source_id.split(":")
+            # Single scan for the basename instead of an `in` check plus split
+            filename = source_parts[0].rpartition("/")[2]
             
             # Parse the new format: file:page:paragraph:chunk
             if len(source_parts) >= 4:
-                file_path, page_num, paragraph_num, chunk_num = source_parts[0], source_parts[1], source_parts[2], source_parts[3]
-                filename = file_path.split("/")[-1] if "/" in file_path else file_path
+                page_num, paragraph_num, chunk_num = source_parts[1], source_parts[2], source_parts[3]
                 # Create a more informative page reference
                 page_ref = f"{page_num} (¶{paragraph_num}.{chunk_num})"
             elif len(source_parts) >= 3:
-                file_path, page_num, paragraph_num = source_parts[0], source_parts[1], source_parts[2]
-                filename = file_path.split("/")[-1] if "/" in file_path else file_path
+                page_num, paragraph_num = source_parts[1], source_parts[2]
                 page_ref = f"{page_num} (¶{paragraph_num})"
             elif len(source_parts) >= 2:
-                file_path, page_num = source_parts[0], source_parts[1]
-                filename = file_path.split("/")[-1] if "/" in file_path else file_path
-                page_ref = page_num
+                page_ref = source_parts[1]
             else:
                 filename, page_ref = "Unknown Document", "N/A"
             
@@ -59,31 +91,9 @@ class CitationManager:
 
     def _remove_filename_references(self, content: str, filename: str) -> str:
         """Remove filename and common document metadata from content."""
-        import re
-        
-        # Remove file extension and get base name
-        base_filename = filename.replace('.pdf', '').replace('.txt', '').replace('.docx', '')
-        
-        # Remove various patterns that might include filename
-        patterns_to_remove = [
-            # Exact filename matches at end of content
-            rf'\s*{re.escape(filename)}\s*$',
-            rf'\s*{re.escape(base_filename)}\s*$',
-            # Common patterns with numbers (like "effective headline 1311")
-            rf'\s*{re.escape(base_filename)}\s*\d+\s*$',
-            # Remove trailing numbers that might be page numbers or file references
-            r'\s*\d{3,4}\s*$',  # Remove 3-4 digit numbers at end
-            # Remove common document footers
-            r'\s*Page \d+.*$',
-            r'\s*p\.\s*\d+.*$',
-            r'\s*\d+/\d+\s*$',  # Page numbers like "1/10"
-            # Remove trailing whitespace and cleanup
-            r'\s+$'
-        ]
-        
         cleaned_content = content
-        for pattern in patterns_to_remove:
-            cleaned_content = re.sub(pattern, '', cleaned_content, flags=re.IGNORECASE)
+        for pattern in _filename_patterns(filename) + TRAILING_METADATA_PATTERNS:
+            cleaned_content = pattern.sub('', cleaned_content)
         
         return cleaned_content.strip()
 
@@ -98,16 +108,15 @@ class CitationManager:
         and returns a structured result.
         """
         # Find all cited source numbers, preserving order of appearance
-        cited_nums_str = re.findall(r'\[Source (\d+)\]', response_text)
+        cited_nums_str = SOURCE_CITATION_RE.findall(response_text)
         cited_original_nums = [int(num) for num in cited_nums_str]
         
         # Get unique, valid citations in order of first appearance
-        used_citations_ordered = []
-        seen = set()
-        for num in cited_original_nums:
-            if num not in seen and 1 <= num <= self.k_chunks:
-                seen.add(num)
-                used_citations_ordered.append(self.lookup[num])
+        # (dict.fromkeys de-duplicates in C while keeping insertion order)
+        used_citations_ordered = [
+            self.lookup[num] for num in dict.fromkeys(cited_original_nums)
+            if num in self.lookup
+        ]
 
         if not used_citations_ordered:
             return ProcessedLLMResponse(renumbered_response_text=response_text, used_citations=[])
@@ -115,37 +124,21 @@ class CitationManager:
         # Create a mapping from original numbers to new sequential numbers (1, 2, 3...)
         renumber_map = {citation.source_num: new_num for new_num, citation in enumerate(used_citations_ordered, 1)}
 
-        # Renumber the response text using a safe, two-step replacement
-        renumbered_text = response_text
-        
-        # Step 1: Replace valid citations with temporary, unique placeholders
-        for original_num, new_num in renumber_map.items():
-            renumbered_text = re.sub(
-                f'\[Source {original_num}\]', 
-                f"__TEMP_SOURCE_{new_num}__", 
-                renumbered_text
-            )
+        # Renumber the response text in a single pass. Valid citations are mapped to
+        # their new numbers and any citation the LLM generated beyond k_chunks is
+        # removed; doing it in one substitution avoids collisions between old and new numbers.
+        def renumber(match: re.Match) -> str:
+            new_num = renumber_map.get(int(match.group(1)))
+            return f"[Source {new_num}]" if new_num is not None else ''
         
-        # Step 2: Remove any remaining invalid citations (outside our valid range)
-        # This handles cases where LLM generates citations beyond k_chunks
-        for num in cited_original_nums:
-            if num < 1 or num > self.k_chunks:
-                renumbered_text = re.sub(f'\[Source {num}\]', '', renumbered_text)
+        renumbered_text = SOURCE_CITATION_RE.sub(renumber, response_text)
         
-        # Step 2.5: Remove original citations from source documents (like [23], [12], etc.)
+        # Remove original citations from source documents (like [23], [12], etc.)
         # These are citations that existed in the original documents, not our RAG citations
-        renumbered_text = re.sub(r'\[(\d+)\]', '', renumbered_text)
-        
-        # Step 3: Replace placeholders with final, renumbered citation format
-        for original_num, new_num in renumber_map.items():
-            renumbered_text = re.sub(
-                f"__TEMP_SOURCE_{new_num}__",
-                f"[Source {new_num}]",
-                renumbered_text
-            )
+        renumbered_text = DOCUMENT_CITATION_RE.sub('', renumbered_text)
         
-        # Step 4: Clean up any extra whitespace left by removed citations
-        renumbered_text = re.sub(r'\s+', ' ', renumbered_text).strip()
+        # Clean up any extra whitespace left by removed citations
+        renumbered_text = WHITESPACE_RE.sub(' ', renumbered_text).strip()
         
         # Create the final list of renumbered citation objects
         final_citations = []
@@ -1,9 +1,12 @@
+import re
 from typing import List, Dict, Any
 from citation_models import RenumberedCitation
 from document_service import DocumentService
 from pdf_viewer_component import PDFViewerComponent
 import streamlit as st
 
+PAGE_NUM_RE = re.compile(r'(\d+)')
+
 class CitationNavigation:
     """
     Handles navigation functionality for citations.
@@ -82,10 +85,8 @@ class CitationNavigation:
     
     def _extract_page_number(self, page_str: str) -> int:
         """Extract numeric page number from page string."""
-        import re
-        
         # Handle formats like "5 (¶2.1)" or just "5"
-        match = re.search(r'(\d+)', str(page_str))
+        match = PAGE_NUM_RE.search(str(page_str))
         if match:
             return int(match.group(1))
         return 1
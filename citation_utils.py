@@ -2,6 +2,28 @@
 import re
 from typing import List, Dict, Any
 
+# Common HTML entities and their plain-text replacements
+HTML_ENTITIES = {
+    '&nbsp;': ' ',
+    '&amp;': '&',
+    '&lt;': '<',
+    '&gt;': '>',
+    '&quot;': '"',
+    '&#39;': "'",
+    '&apos;': "'",
+    '&hellip;': '...',
+    '&mdash;': '—',
+    '&ndash;': '–',
+    '&rsquo;': "'",
+    '&lsquo;': "'",
+    '&rdquo;': '"',
+    '&ldquo;': '"'
+}
+
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+HTML_ENTITY_RE = re.compile('|'.join(re.escape(entity) for entity in HTML_ENTITIES))
+WHITESPACE_RE = re.compile(r'\s+')
+
 def strip_html_tags(text: str) -> str:
     """
     Remove HTML tags from text and clean up common HTML entities.
@@ -15,32 +37,15 @@ def strip_html_tags(text: str) -> str:
     if not text:
         return text
     
-    # Remove HTML tags
-    clean_text = re.sub(r'<[^>]+>', '', text)
-    
-    # Replace common HTML entities
-    html_entities = {
-        '&nbsp;': ' ',
-        '&amp;': '&',
-        '&lt;': '<',
-        '&gt;': '>',
-        '&quot;': '"',
-        '&#39;': "'",
-        '&apos;': "'",
-        '&hellip;': '...',
-        '&mdash;': '—',
-        '&ndash;': '–',
-        '&rsquo;': "'",
-        '&lsquo;': "'",
-        '&rdquo;': '"',
-        '&ldquo;': '"'
-    }
+    # Remove HTML tags (PDF text rarely has any, so skip the scan when possible)
+    clean_text = HTML_TAG_RE.sub('', text) if '<' in text else text
     
-    for entity, replacement in html_entities.items():
-        clean_text = clean_text.replace(entity, replacement)
+    # Replace common HTML entities in a single pass
+    if '&' in clean_text:
+        clean_text = HTML_ENTITY_RE.sub(lambda m: HTML_ENTITIES[m.group(0)], clean_text)
     
     # Clean up extra whitespace
-    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+    clean_text = WHITESPACE_RE.sub(' ', clean_text).strip()
     
     return clean_text
 
@@ -84,13 +89,7 @@ def extract_citations_from_text(text: str) -> List[str]:
     plain_citations = re.findall(pattern_plain, text)
     
     # Combine all and remove duplicates while preserving order
-    seen = set()
-    citations = []
-    for c in brackets_citations + parens_citations + plain_citations:
-        if c not in seen:
-            seen.add(c)
-            citations.append(c)
-    return citations
+    return list(dict.fromkeys(brackets_citations + parens_citations + plain_citations))
 
 
 def normalize_citation(citation: str) -> str:
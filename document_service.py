@@ -1,8 +1,83 @@
+import hashlib
+import json
 import os
+import re
+import time
 import urllib.parse
-from typing import Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
 
+# orjson is optional; it serializes the viewer chunk data several times faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dump_json(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def load_json(data: bytes) -> Any:
+    """Parse JSON produced by dump_json."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Chunk data handed from the chat app to the standalone viewer. Both apps run on the
+# same machine, so the data is stored on disk under a short content key and only
+# the key travels in the viewer URL.
+# Anchored next to this module, so both apps find it whatever directory they start in.
+VIEWER_PAYLOAD_PATH = Path(__file__).parent / ".viewer_payloads"
+VIEWER_PAYLOAD_KEY_RE = re.compile(r'[0-9a-f]{16}')
+
+# Payloads not stored again for this long are deleted the next time a new one is written
+VIEWER_PAYLOAD_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+
+def store_viewer_payload(chunks: List[Dict[str, Any]]) -> str:
+    """Store chunk data for the standalone viewer and return the key to pass in its URL."""
+    raw = dump_json(chunks)
+    key = hashlib.sha1(raw).hexdigest()[:16]
+    payload_file = VIEWER_PAYLOAD_PATH / f"{key}.json"
+    
+    # Same chunks, same key: the file only has to be written once, later stores just
+    # mark it as recently used
+    if payload_file.exists():
+        os.utime(payload_file)
+    else:
+        VIEWER_PAYLOAD_PATH.mkdir(parents=True, exist_ok=True)
+        temp_file = payload_file.with_suffix(f".{os.getpid()}.tmp")
+        temp_file.write_bytes(raw)
+        os.replace(temp_file, payload_file)
+        prune_viewer_payloads()
+    
+    return key
+
+
+def prune_viewer_payloads() -> None:
+    """Delete stored payloads (and leftover temporary files) that have not been used recently."""
+    cutoff = time.time() - VIEWER_PAYLOAD_MAX_AGE_SECONDS
+    for payload_file in VIEWER_PAYLOAD_PATH.iterdir():
+        try:
+            if payload_file.stat().st_mtime < cutoff:
+                payload_file.unlink()
+        except FileNotFoundError:
+            # Removed concurrently by another process
+            pass
+
+
+def load_viewer_payload(key: str) -> List[Dict[str, Any]]:
+    """Load chunk data stored by store_viewer_payload."""
+    if not VIEWER_PAYLOAD_KEY_RE.fullmatch(key):
+        raise ValueError(f"Invalid viewer key: {key!r}")
+    return load_json((VIEWER_PAYLOAD_PATH / f"{key}.json").read_bytes())
+
+
 class DocumentService:
     """
     Service for handling document navigation and serving functionality.
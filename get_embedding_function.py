@@ -1,5 +1,8 @@
+from functools import lru_cache
 from langchain_community.embeddings import HuggingFaceEmbeddings
 
+@lru_cache(maxsize=None)
 def get_embedding_function():
-    # Return sentence-transformers/all-MiniLM-L6-v2 embeddings
+    # Return sentence-transformers/all-MiniLM-L6-v2 embeddings.
+    # Loading the model is expensive, so it is built once per process and shared.
     return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
\ No newline at end of file
@@ -7,13 +7,22 @@ from typing import List, Optional
 import os
 import shutil
 import json
-import base64
+import mmap
 from pathlib import Path
 import tempfile
 
+# pybase64 uses a SIMD codec; fall back to the standard library when it isn't installed
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
 # Import existing modules
-from processing import load_documents, split_documents, add_to_chroma, clear_database
-from query_data import query_rag
+from processing import (
+    load_documents, split_documents, add_to_chroma, clear_database,
+    find_changed_documents, load_manifest, save_manifest
+)
+from query_data import query_rag, reset_db, clear_response_cache
 from document_service import DocumentService
 from citation_manager import CitationManager
 # from citation_navigation import CitationNavigation
@@ -85,10 +94,15 @@ async def upload_documents(files: List[UploadFile] = File(...)):
             
             uploaded_files.append(file.filename)
         
-        # Process documents
-        documents = load_documents()
-        chunks = split_documents(documents)
-        add_to_chroma(chunks)
+        # Process the documents that are new or changed since the last ingest
+        changed_paths, manifest = find_changed_documents(load_manifest())
+        if changed_paths:
+            documents = load_documents(changed_paths)
+            chunks = split_documents(documents)
+            add_to_chroma(chunks, replace_sources=changed_paths)
+            save_manifest(manifest)
+            # Cached answers predate the new documents
+            clear_response_cache()
         
         return ProcessingStatus(
             status="success",
@@ -164,8 +178,14 @@ async def get_document_base64(filename: str):
         if not file_path.exists():
             raise HTTPException(status_code=404, detail="Document not found")
         
+        # Encode straight from a memory map instead of reading a full copy of the file first
+        # (an empty file cannot be mapped, and encodes to an empty string anyway)
         with open(file_path, "rb") as f:
-            pdf_data = base64.b64encode(f.read()).decode()
+            if os.fstat(f.fileno()).st_size == 0:
+                pdf_data = ""
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    pdf_data = base64.b64encode(mm).decode("ascii")
         
         return {"filename": filename, "data": pdf_data}
     except Exception as e:
@@ -175,8 +195,9 @@ async def get_document_base64(filename: str):
 async def clear_documents():
     """Clear all documents and reset the database."""
     try:
-        # Clear the vector database
+        # Clear the vector database and drop the cached handle to it
         clear_database()
+        reset_db()
         
         # Remove all PDF files from data directory (optional)
         data_path = Path("data")
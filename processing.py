@@ -1,8 +1,14 @@
 
 import argparse
+import hashlib
+import json
 import os
 import shutil
-from langchain_community.document_loaders.pdf import PyPDFDirectoryLoader
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+from langchain_community.document_loaders.pdf import PyPDFDirectoryLoader, PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
 from get_embedding_function import get_embedding_function
@@ -12,6 +18,18 @@ from langchain_community.vectorstores import Chroma
 CHROMA_PATH = "chroma"
 DATA_PATH = "data"
 
+# {path: {"sha1", "mtime_ns", "size"}} of every PDF already ingested, so unchanged
+# files are not parsed again. It lives inside the Chroma directory, so whatever removes
+# the store also forgets what was ingested into it.
+MANIFEST_PATH = os.path.join(CHROMA_PATH, "ingest_manifest.json")
+HASH_BLOCK_SIZE = 1 << 20
+
+# PDFs passed to load_documents explicitly are parsed on up to this many threads
+LOAD_WORKERS = min(8, os.cpu_count() or 1)
+
+# New chunks are embedded and written to Chroma in batches of this size
+ADD_BATCH_SIZE = 2000
+
 
 def main():
 
@@ -23,15 +41,84 @@ def main():
         print("Clearing Database")
         clear_database()
 
-    # Create (or update) the data store.
-    documents = load_documents()
+    # Create (or update) the data store from the PDFs that changed since the last run.
+    changed_paths, manifest = find_changed_documents(load_manifest())
+    if not changed_paths:
+        print("No new or changed documents")
+        return
+    print(f"Loading new or changed documents: {len(changed_paths)}")
+    documents = load_documents(changed_paths)
     chunks = split_documents(documents)
-    add_to_chroma(chunks)
+    add_to_chroma(chunks, replace_sources=changed_paths)
+    save_manifest(manifest)
+
+
+def load_documents(paths: Optional[list[str]] = None):
+    """Load every PDF in the data folder, or only the given PDF paths."""
+    if paths is None:
+        document_loader = PyPDFDirectoryLoader(DATA_PATH)
+        return document_loader.load()
+    
+    documents = []
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as executor:
+        # map keeps the input order, so chunk ids come out the same as a serial load
+        for file_documents in executor.map(_load_pdf, paths):
+            documents.extend(file_documents)
+    return documents
+
+
+def _load_pdf(path: str) -> list[Document]:
+    return PyPDFLoader(path).load()
 
 
-def load_documents():
-    document_loader = PyPDFDirectoryLoader(DATA_PATH)
-    return document_loader.load()
+def file_sha1(path: Path) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def load_manifest() -> dict:
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest: dict):
+    # Write to a temporary file first so an interrupted run never leaves a partial manifest
+    # (uniquely named, so concurrent ingests from the app and the API don't clash)
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=CHROMA_PATH, suffix=".tmp", delete=False) as f:
+        json.dump(manifest, f)
+    os.replace(f.name, MANIFEST_PATH)
+
+
+def find_changed_documents(manifest: dict) -> tuple[list[str], dict]:
+    """
+    Compare the PDFs in the data folder against the manifest.
+    Returns the paths that are new or whose content changed, and the updated manifest
+    to save once they are ingested. Files whose mtime and size match the manifest are
+    not hashed again.
+    """
+    changed_paths = []
+    new_manifest = {}
+    # Same selection as PyPDFDirectoryLoader: hidden files and folders are skipped
+    for path in sorted(Path(DATA_PATH).glob("**/[!.]*.pdf")):
+        if any(part.startswith(".") for part in path.parts):
+            continue
+        key = str(path)
+        stat = path.stat()
+        entry = manifest.get(key)
+        if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            sha1 = file_sha1(path)
+            if entry is None or entry["sha1"] != sha1:
+                changed_paths.append(key)
+            entry = {"sha1": sha1, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        new_manifest[key] = entry
+    return changed_paths, new_manifest
 
 
 def split_documents(documents: list[Document]):
@@ -80,11 +167,31 @@ def split_documents(documents: list[Document]):
     return chunks
 
 
-def add_to_chroma(chunks: list[Document]):
+def add_to_chroma(
+    chunks: list[Document],
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    db: Optional[Chroma] = None,
+    replace_sources: Optional[list[str]] = None
+):
+    """
+    Add the chunks that are not in the database yet.
+    progress_callback, if given, is called with (added, total) after each batch.
+    db is an already open Chroma handle to reuse; by default the database is opened here.
+    replace_sources lists source files whose stored chunks are deleted first, so a
+    changed file's new chunks are written instead of being skipped as existing ids.
+    """
     # Load the existing database.
-    db = Chroma(
-        persist_directory=CHROMA_PATH, embedding_function=get_embedding_function()
-    )
+    if db is None:
+        db = Chroma(
+            persist_directory=CHROMA_PATH, embedding_function=get_embedding_function()
+        )
+
+    # Drop the outdated chunks of files that are being ingested again.
+    for source in replace_sources or []:
+        stale_ids = db.get(where={"source": source}, include=[])["ids"]
+        if stale_ids:
+            print(f"Replacing {len(stale_ids)} existing chunks of {source}")
+            db.delete(ids=stale_ids)
 
     # Calculate Page IDs.
     chunks_with_ids = calculate_chunk_ids(chunks)
@@ -102,8 +209,11 @@ def add_to_chroma(chunks: list[Document]):
 
     if len(new_chunks):
         print(f"Adding new documents: {len(new_chunks)}")
-        new_chunk_ids = [chunk.metadata["id"] for chunk in new_chunks]
-        db.add_documents(new_chunks, ids=new_chunk_ids)
+        for start in range(0, len(new_chunks), ADD_BATCH_SIZE):
+            batch = new_chunks[start:start + ADD_BATCH_SIZE]
+            db.add_documents(batch, ids=[chunk.metadata["id"] for chunk in batch])
+            if progress_callback is not None:
+                progress_callback(start + len(batch), len(new_chunks))
         db.persist()
     else:
         print("No new documents to add")
@@ -1,6 +1,15 @@
 
 import argparse
+import html
+import os
 import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional, Tuple
+
+import numpy as np
 from langchain_community.vectorstores.chroma import Chroma
 from langchain.prompts import ChatPromptTemplate
 from langchain_community.llms.ollama import Ollama
@@ -10,9 +19,39 @@ from citation_manager import CitationManager
 from citation_models import RenumberedCitation
 from get_embedding_function import get_embedding_function
 
+# Navigation enhancement is optional; build the handler once at import time
+try:
+    from citation_navigation import CitationNavigation
+    _NAV_HANDLER = CitationNavigation()
+except ImportError:
+    _NAV_HANDLER = None
+
 CHROMA_PATH = "chroma"
 
-PROMPT_TEMPLATE = """
+SOURCE_BRACKET_RE = re.compile(r'\[Source (\d+)\]')
+
+# LRU cache of query embeddings so re-submitted queries skip the model forward pass
+QUERY_EMBEDDING_CACHE_SIZE = 512
+_query_embedding_cache: "OrderedDict[str, list[float]]" = OrderedDict()
+_query_embedding_lock = threading.Lock()
+
+# Shared Chroma handle, created lazily by get_db()
+_db = None
+_db_lock = threading.Lock()
+
+# Semantic cache of complete query results, keyed by the (normalized) query embedding.
+# A new query whose cosine similarity to a cached one reaches the threshold reuses its result.
+RESPONSE_CACHE_SIZE = 128
+RESPONSE_CACHE_SIMILARITY = 0.95
+RESPONSE_CACHE_TTL_SECONDS = 3600
+_response_cache: list[tuple[np.ndarray, dict, float]] = []
+_response_cache_lock = threading.Lock()
+
+LLM_MODEL = "llama3.2:latest"
+
+# Static instructions are sent as the Ollama system prompt so that every request
+# starts with an identical prefix and the server can reuse its cached KV state for it.
+SYSTEM_PROMPT = """
 Answer the question based only on the following context. Provide a detailed answer which is complete and covers the topics of the context while being only answering through the context provided. 
 When making claims or statements, include inline citations using the format [Source X], where X is the source number provided.
 
@@ -31,9 +70,10 @@ You must strictly follow these citation rules:
 5. CRITICAL:  Do not say "according to Source X" or "Source X says." The citation should come only at the end of the sentence or clause, not embedded in the sentence.
 6. If no source/context that has been provided supports the claim, say "The answer cannot be determined from the given sources." Never mention the sources or that sources were provided if the answer cannot be determined from the given sources.
 7. Be extremely careful not to make any statement without proper citation - even if it seems obvious or general knowledge, if it appears in the context, it must be cited.
+"""
 
---- 
-
+# Per-query part of the prompt
+PROMPT_TEMPLATE = """
 Context:
 {context}
 
@@ -49,17 +89,44 @@ def format_response_with_tooltips(response_text: str, citations: list[Renumbered
     Format response text with HTML-style tooltip attributes for web display.
     This function adds data attributes that can be used by frontend tooltip libraries.
     """
-    formatted_response = response_text
+    # Uncited answers (e.g. "cannot be determined") need no scan at all
+    if not citations or "[Source " not in response_text:
+        return response_text
+
+    # Build each tooltip span once, then substitute every citation in a single pass
+    tooltip_spans = {}
     for citation in citations:
-        escaped_tooltip = citation.content.replace('"', '"').replace("'", "'")
-        tooltip_span = f'<span class="citation-tooltip" data-tooltip="{escaped_tooltip}" title="{escaped_tooltip}">[Source {citation.new_source_num}]</span>'
-        # Important: Match the exact renumbered citation string
-        formatted_response = re.sub(
-            f'\[Source {citation.new_source_num}\]',
-            tooltip_span,
-            formatted_response
+        escaped_tooltip = html.escape(citation.content, quote=True)
+        tooltip_spans[citation.new_source_num] = (
+            f'<span class="citation-tooltip" data-tooltip="{escaped_tooltip}" title="{escaped_tooltip}">'
+            f'[Source {citation.new_source_num}]</span>'
         )
-    return formatted_response
+
+    # Important: Match the exact renumbered citation string
+    return SOURCE_BRACKET_RE.sub(
+        lambda match: tooltip_spans.get(int(match.group(1)), match.group(0)),
+        response_text
+    )
+
+def embed_query_cached(embedding_function, query_text: str) -> list[float]:
+    """
+    Return the embedding for a query, reusing the result for recently seen queries.
+    Queries that differ only in case or whitespace share a cache entry.
+    """
+    cache_key = " ".join(query_text.split()).casefold()
+    with _query_embedding_lock:
+        embedding = _query_embedding_cache.get(cache_key)
+        if embedding is not None:
+            _query_embedding_cache.move_to_end(cache_key)
+            return embedding
+
+    embedding = embedding_function.embed_query(query_text)
+
+    with _query_embedding_lock:
+        _query_embedding_cache[cache_key] = embedding
+        if len(_query_embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embedding_cache.popitem(last=False)
+    return embedding
 
 def main():
     parser = argparse.ArgumentParser()
@@ -84,26 +151,95 @@ def main():
     else:
         print(result["formatted_response"])
 
-def query_rag(query_text: str):
-    # Prepare the DB.
-    embedding_function = get_embedding_function()
+def _open_db(embedding_function) -> Chroma:
     try:
-        db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+        return Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
     except Exception as e:
         # If there's a tenant issue, try recreating the database
-        import os
-        import shutil
         if "tenant" in str(e).lower():
             if os.path.exists(CHROMA_PATH):
                 shutil.rmtree(CHROMA_PATH)
             # Try creating a fresh database
-            db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
-        else:
-            raise e
+            return Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+        raise e
+
+def _normalize(embedding: list[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def lookup_cached_response(query_vector: np.ndarray) -> Optional[dict]:
+    """Return the cached result of the most similar recent query, if it is similar enough."""
+    now = time.monotonic()
+    best_result, best_similarity = None, RESPONSE_CACHE_SIMILARITY
+    with _response_cache_lock:
+        # Drop expired entries before scanning
+        _response_cache[:] = [entry for entry in _response_cache if now - entry[2] < RESPONSE_CACHE_TTL_SECONDS]
+        for cached_vector, result, _ in _response_cache:
+            similarity = float(np.dot(cached_vector, query_vector))
+            if similarity >= best_similarity:
+                best_result, best_similarity = result, similarity
+    return best_result
+
+def store_cached_response(query_vector: np.ndarray, result: dict) -> None:
+    with _response_cache_lock:
+        _response_cache.append((query_vector, result, time.monotonic()))
+        if len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.pop(0)
+
+def clear_response_cache() -> None:
+    with _response_cache_lock:
+        _response_cache.clear()
+
+def get_db() -> Chroma:
+    """
+    Return the shared Chroma handle, opening it on first use.
+    The handle (and its embedding model) is reused across query_rag calls.
+    """
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = _open_db(get_embedding_function())
+    return _db
+
+def reset_db() -> None:
+    """
+    Drop the cached Chroma handle, e.g. after the database directory was cleared.
+    Cached responses refer to the old documents, so they are dropped too.
+    """
+    global _db
+    with _db_lock:
+        _db = None
+    clear_response_cache()
+
+def query_rag(query_text: str):
+    # Consume the stream in one go for callers that want the complete result.
+    response_stream, finalize = query_rag_stream(query_text)
+    return finalize("".join(response_stream))
+
+def query_rag_stream(query_text: str) -> Tuple[Iterator[str], Callable[[str], dict]]:
+    """
+    Retrieve context and start streaming the LLM answer for a query.
+    Returns an iterator over the response text chunks as Ollama generates them, and a
+    finalize(response_text) callable that runs the citation post-processing once the
+    stream is complete and returns the same result dict as query_rag.
+    """
+    embedding_function = get_embedding_function()
+    query_embedding = embed_query_cached(embedding_function, query_text)
+
+    # Serve near-duplicate queries from the semantic cache, skipping retrieval and the LLM.
+    query_vector = _normalize(query_embedding)
+    cached_result = lookup_cached_response(query_vector)
+    if cached_result is not None:
+        return iter([cached_result["response_text"]]), lambda response_text: cached_result
+
+    # Prepare the DB (cached across calls).
+    db = get_db()
     k_chunks = 5
 
-    # Search the DB.
-    results = db.similarity_search_with_score(query_text, k=k_chunks)
+    # Search the DB with the (possibly cached) query vector.
+    results = db.similarity_search_by_vector_with_relevance_scores(query_embedding, k=k_chunks)
 
     # --- REFACTORED SECTION START ---
     
@@ -116,18 +252,28 @@ def query_rag(query_text: str):
     prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
     prompt = prompt_template.format(context=context_text, question=query_text)
 
-    model = Ollama(model="llama3.2:latest")
-    response_text = model.invoke(prompt)
+    model = Ollama(model=LLM_MODEL, system=SYSTEM_PROMPT)
+    response_stream = model.stream(prompt)
+
+    def finalize(response_text: str) -> dict:
+        result = _build_result(citation_manager, context_text, response_text)
+        store_cached_response(query_vector, result)
+        return result
+
+    return response_stream, finalize
 
+def _build_result(citation_manager: CitationManager, context_text: str, response_text: str) -> dict:
     # 3. Process the response to get renumbered text and used citations
     processed_response = citation_manager.process_response(response_text)
 
     # 4. Format the final output based on the structured result
     if processed_response.used_citations:
         # Create the simple citation list for text display
-        citation_list = "\n\nSources:\n"
-        for citation in processed_response.used_citations:
-            citation_list += f"[Source {citation.new_source_num}] {citation.filename}, p. {citation.page}\n"
+        citation_lines = [
+            f"[Source {citation.new_source_num}] {citation.filename}, p. {citation.page}"
+            for citation in processed_response.used_citations
+        ]
+        citation_list = "\n\nSources:\n" + "\n".join(citation_lines) + "\n"
         
         formatted_response = f"{processed_response.renumbered_response_text}{citation_list}"
         
@@ -150,11 +296,9 @@ def query_rag(query_text: str):
             })
         
         # Add navigation enhancement (new functionality)
-        try:
-            from citation_navigation import CitationNavigation
-            nav_handler = CitationNavigation()
-            enhanced_citations = nav_handler.enhance_citations_with_navigation(citations_dict)
-        except ImportError:
+        if _NAV_HANDLER is not None:
+            enhanced_citations = _NAV_HANDLER.enhance_citations_with_navigation(citations_dict)
+        else:
             # Fallback to original citations if navigation module not available
             enhanced_citations = citations_dict
         
@@ -16,6 +16,8 @@ def main():
     env = os.environ.copy()
     env['STREAMLIT_SERVER_PORT'] = str(viewer_port)
     env['STREAMLIT_SERVER_HEADLESS'] = 'true'
+    # Serve ./static so the viewer can stream PDFs instead of inlining them
+    env['STREAMLIT_SERVER_ENABLE_STATIC_SERVING'] = 'true'
     
     print(f"Starting standalone PDF viewer on port {viewer_port}...")
     print(f"Viewer will be available at: http://localhost:{viewer_port}")
@@ -26,7 +28,8 @@ def main():
             sys.executable, "-m", "streamlit", "run", 
             "standalone_pdf_viewer.py",
             "--server.port", str(viewer_port),
-            "--server.headless", "true"
+            "--server.headless", "true",
+            "--server.enableStaticServing", "true"
         ], env=env)
     except KeyboardInterrupt:
         print("\nShutting down standalone PDF viewer...")
@@ -1,12 +1,86 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import base64
-import json
+import os
+import shutil
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 import urllib.parse
 import re
 
+from document_service import dump_json, load_viewer_payload
+
+PAGE_NUM_RE = re.compile(r'(\d+)')
+
+# Words are compared as runs of letters and digits, so punctuation or numbering attached
+# to a word ("(the", "results.", "1.Introduction") doesn't prevent a match. The page
+# script tokenizes the text layer the same way (/[\p{L}\p{N}]+/gu).
+WORD_RE = re.compile(r'[^\W_]+')
+
+# PDFs are published under Streamlit's static folder (server.enableStaticServing)
+# so the browser can fetch them directly instead of receiving them base64-encoded.
+STATIC_PDF_PATH = Path(__file__).parent / "static" / "pdfs"
+STATIC_PDF_URL = "/app/static/pdfs"
+
+# pdf.js location. Point PDFJS_BASE_URL at a self-hosted copy of the same release to
+# avoid the third-party round-trip (Streamlit's own static route serves .js as text/plain).
+PDFJS_BASE_URL = os.environ.get("PDFJS_BASE_URL", "https://cdnjs.cloudflare.com/ajax/libs/pdf.js/3.11.174").rstrip("/")
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _publish_static_pdf(path_str: str, relative_path: str, mtime_ns: int, size: int) -> str:
+    """
+    Copy a PDF into the static folder (if out of date) and return its URL path.
+    relative_path is the PDF's path inside the data folder, kept as-is so files with the
+    same name in different subfolders don't overwrite each other.
+    """
+    static_file = STATIC_PDF_PATH / relative_path
+    static_file.parent.mkdir(parents=True, exist_ok=True)
+    
+    if (not static_file.exists()
+            or static_file.stat().st_mtime_ns < mtime_ns
+            or static_file.stat().st_size != size):
+        shutil.copy2(path_str, static_file)
+    
+    return f"{STATIC_PDF_URL}/{urllib.parse.quote(relative_path)}"
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _build_chunk_map_json(chunks: Tuple[Tuple[Any, Any, str], ...]) -> str:
+    """
+    Build the viewer's chunk map from (source_num, page, tooltip_text) triples and
+    return it serialized for the page script.
+    """
+    chunk_map = {}
+    for source_num, page, tooltip_text in chunks:
+        chunk_id = f"chunk-{source_num}"
+        
+        # Use the page number as-is (already corrected in processing.py)
+        # Plain page numbers convert directly; otherwise extract the numeric part
+        # from the page string (handles cases like '3 (¶1.2)')
+        try:
+            page_num = int(page)
+        except (TypeError, ValueError):
+            page_match = PAGE_NUM_RE.search(str(page))
+            page_num = int(page_match.group(1)) if page_match else 1
+        
+        # Word sequences used to locate the chunk in the page text, so the page script
+        # never receives or splits the full chunk text.
+        # Chunks shorter than 3 words are too short to match reliably and get none.
+        words = WORD_RE.findall(tooltip_text.lower())
+        if len(words) >= 3:
+            first_words, last_words = ' '.join(words[:5]), ' '.join(words[-5:])
+        else:
+            first_words, last_words = '', ''
+        
+        # Only what the sidebar and highlighting use is shipped to the browser
+        chunk_map[chunk_id] = {
+            'source_num': source_num,
+            'page': page_num,
+            'preview': tooltip_text[:200] + "...",
+            'first_words': first_words,
+            'last_words': last_words
+        }
+    
+    return dump_json(chunk_map).decode("utf-8")
+
 class StandalonePDFViewer:
     """
     Standalone PDF viewer that opens in a new tab with chunk navigation.
@@ -42,7 +116,7 @@ class StandalonePDFViewer:
         # Get parameters from URL
         query_params = st.query_params
         filename = query_params.get("file", "")
-        chunk_data = query_params.get("chunks", "")
+        viewer_key = query_params.get("key", "")
         active_chunk = query_params.get("active", "")
         
         if not filename:
@@ -50,9 +124,9 @@ class StandalonePDFViewer:
             st.info("🔙 [Return to Main Interface](http://localhost:8501)")
             st.stop()
         
-        # Decode chunk data
+        # Look up the chunk data stored by the chat app
         try:
-            chunks = json.loads(urllib.parse.unquote(chunk_data)) if chunk_data else []
+            chunks = load_viewer_payload(viewer_key) if viewer_key else []
         except Exception as e:
             st.error(f"❌ Error loading document data: {e}")
             st.stop()
@@ -72,55 +146,167 @@ class StandalonePDFViewer:
     
     def _create_standalone_viewer(self, filename: str, chunks: List[Dict], active_chunk: str = ""):
         """Create the standalone PDF viewer with chunk navigation."""
-        file_path = self.data_path / filename
-        
-        if not file_path.exists():
+        # Publish the PDF as a static file; the viewer streams it from that URL.
+        # The stat() done for publishing doubles as the existence check.
+        try:
+            pdf_url = self._publish_pdf(filename)
+        except ValueError:
+            st.error(f"Invalid document: {filename}")
+            return
+        except FileNotFoundError:
             st.error(f"PDF file not found: {filename}")
             return
-        
-        # Encode PDF to base64
-        try:
-            with open(file_path, "rb") as f:
-                pdf_data = base64.b64encode(f.read()).decode()
         except Exception as e:
             st.error(f"Error loading PDF: {e}")
             return
         
-        # Process chunks for viewer
-        chunk_map = {}
-        for chunk in chunks:
-            source_num = chunk.get('source_num', 1)
-            chunk_id = f"chunk-{source_num}"
-            
-            # Use the page number as-is (already corrected in processing.py)
-            page = chunk.get('page', 1)
-            # Extract numeric part from page string (handles cases like '3 (¶1.2)')
-            if isinstance(page, str):
-                page_match = re.search(r'(\d+)', page)
-                page_num = int(page_match.group(1)) if page_match else 1
-            else:
-                page_num = int(page) if isinstance(page, int) else 1
-            
-            chunk_map[chunk_id] = {
-                'source_num': source_num,
-                'page': page_num,
-                'content': chunk.get('tooltip_text', '')[:200] + "...",
-                'full_content': chunk.get('tooltip_text', ''),
-                'search_text': chunk.get('tooltip_text', '')[:100]  # First 100 chars for search
-            }
+        # Process chunks for viewer (cached, so reruns with the same sources skip the rebuild)
+        chunk_map_json = _build_chunk_map_json(tuple(
+            (chunk.get('source_num', 1), chunk.get('page', 1), chunk.get('tooltip_text', ''))
+            for chunk in chunks
+        ))
         
         # Generate the HTML for the standalone viewer
-        viewer_html = self._generate_html(pdf_data, filename, chunk_map, active_chunk)
+        viewer_html = self._generate_html(pdf_url, filename, chunk_map_json, active_chunk)
         
         # Display the component with full height (almost full screen)
         components.html(viewer_html, height=900, scrolling=False)
     
-    def _generate_html(self, pdf_data: str, filename: str, chunk_map: Dict, active_chunk: str = "") -> str:
-        """Generate HTML for the standalone PDF viewer."""
-        chunk_map_json = json.dumps(chunk_map)
+    def _publish_pdf(self, filename: str) -> str:
+        """
+        Publish the PDF into the static folder and return the URL path it is served from.
+        The (mtime, size) pair keys the cache, so reruns only cost a single stat().
+        Raises ValueError if filename does not name a PDF inside the data folder: the
+        static folder is public, so nothing else may be copied into it.
+        """
+        data_root = self.data_path.resolve()
+        file_path = (data_root / filename).resolve()
+        if file_path.suffix.lower() != ".pdf" or not file_path.is_relative_to(data_root):
+            raise ValueError(f"Not a PDF in {self.data_path}: {filename!r}")
         
+        source_stat = file_path.stat()
+        return _publish_static_pdf(
+            str(file_path),
+            file_path.relative_to(data_root).as_posix(),
+            source_stat.st_mtime_ns,
+            source_stat.st_size
+        )
+    
+    def _generate_html(self, pdf_url: str, filename: str, chunk_map_json: str, active_chunk: str = "") -> str:
+        """Generate HTML for the standalone PDF viewer."""
         # JavaScript code for text-layer based highlighting
         highlight_js = """
+                // CSS Custom Highlight API where supported; older browsers fall back to a class on each span
+                const chunkHighlight = (window.CSS && CSS.highlights) ? new Highlight() : null;
+                if (chunkHighlight) {
+                    CSS.highlights.set('chunk-hl', chunkHighlight);
+                }
+                // Spans carrying the fallback class, so clearing doesn't scan the whole text layer
+                const currentHighlights = new Set();
+                
+                // Text of the rendered page's text layer and the offset of each span in it
+                let pageTextCache = { map: [], tokens: [], wordPositions: new Map(), windowPositions: new Map(), pageNum: -1 };
+                
+                function buildPageTextCache(num) {
+                    const parts = [];
+                    const map = [];
+                    let offset = 0;
+                    document.querySelectorAll('.textLayer span').forEach(span => {
+                        const spanText = span.textContent;
+                        map.push({
+                            span: span,
+                            text: spanText,
+                            startIndex: offset,
+                            endIndex: offset + spanText.length
+                        });
+                        parts.push(spanText);
+                        offset += spanText.length + 1;
+                    });
+                    const lower = parts.join(' ').toLowerCase();
+                    
+                    // Word tokens (runs of letters and digits, as WORD_RE in Python) with their
+                    // offsets, and the token indices of every word, so phrases are located by
+                    // lookup instead of scanning the page text
+                    const tokens = [];
+                    const wordPositions = new Map();
+                    for (const match of lower.matchAll(/[\\p{L}\\p{N}]+/gu)) {
+                        const positions = wordPositions.get(match[0]);
+                        if (positions) {
+                            positions.push(tokens.length);
+                        } else {
+                            wordPositions.set(match[0], [tokens.length]);
+                        }
+                        tokens.push({ word: match[0], index: match.index });
+                    }
+                    
+                    // Rolling hash over every 5-word window, so a chunk's 5-word boundary
+                    // sequence is found with a single map lookup
+                    const windowPositions = new Map();
+                    let windowHash = 0;
+                    for (let i = 0; i < tokens.length; i++) {
+                        if (i >= WINDOW_WORDS) {
+                            windowHash = (windowHash - Math.imul(wordHash(tokens[i - WINDOW_WORDS].word), WINDOW_POWER)) | 0;
+                        }
+                        windowHash = (Math.imul(windowHash, WINDOW_BASE) + wordHash(tokens[i].word)) | 0;
+                        if (i >= WINDOW_WORDS - 1) {
+                            const key = windowHash >>> 0;
+                            const positions = windowPositions.get(key);
+                            if (positions) {
+                                positions.push(i - WINDOW_WORDS + 1);
+                            } else {
+                                windowPositions.set(key, [i - WINDOW_WORDS + 1]);
+                            }
+                        }
+                    }
+                    
+                    pageTextCache = { map: map, tokens: tokens, wordPositions: wordPositions, windowPositions: windowPositions, pageNum: num };
+                }
+                
+                const WINDOW_WORDS = 5;
+                const WINDOW_BASE = 0x01000193;
+                const WINDOW_POWER = Math.imul(Math.imul(WINDOW_BASE, WINDOW_BASE), Math.imul(WINDOW_BASE, WINDOW_BASE));
+                
+                // 32-bit FNV-1a hash of a word
+                function wordHash(word) {
+                    let hash = 0x811c9dc5;
+                    for (let i = 0; i < word.length; i++) {
+                        hash ^= word.charCodeAt(i);
+                        hash = Math.imul(hash, 0x01000193);
+                    }
+                    return hash;
+                }
+                
+                function phraseHash(words) {
+                    let hash = 0;
+                    for (const word of words) {
+                        hash = (Math.imul(hash, WINDOW_BASE) + wordHash(word)) | 0;
+                    }
+                    return hash >>> 0;
+                }
+                
+                // Offsets {start, end} of the first (or last) occurrence of a lowercased phrase, or null
+                function findPhrase(phrase, fromEnd) {
+                    const words = phrase.split(' ');
+                    const tokens = pageTextCache.tokens;
+                    // Candidate start tokens: same 5-word window hash, or same first word for shorter phrases
+                    const positions = (words.length === WINDOW_WORDS
+                        ? pageTextCache.windowPositions.get(phraseHash(words))
+                        : pageTextCache.wordPositions.get(words[0])) || [];
+                    for (let i = 0; i < positions.length; i++) {
+                        const first = positions[fromEnd ? positions.length - 1 - i : i];
+                        if (first + words.length > tokens.length) continue;
+                        // Hash candidates are verified word by word from the start, so a
+                        // hash collision is never taken for a match
+                        let j = 0;
+                        while (j < words.length && tokens[first + j].word === words[j]) j++;
+                        if (j === words.length) {
+                            const last = tokens[first + words.length - 1];
+                            return { start: tokens[first].index, end: last.index + last.word.length };
+                        }
+                    }
+                    return null;
+                }
+                
                 function highlightChunk(chunkId) {
                     const chunk = chunkMap[chunkId];
                     
@@ -132,77 +318,48 @@ class StandalonePDFViewer:
                     }
                     
                     // Clear previous highlights
-                    const spans = document.querySelectorAll('.textLayer span');
-                    spans.forEach(span => {
-                        span.classList.remove('highlight');
-                        span.style.background = '';
-                        span.style.border = '';
-                        span.style.borderRadius = '';
-                    });
-                    
-                    // Get the full text content
-                    let fullText = '';
-                    if (chunk.full_content) {
-                        fullText = chunk.full_content.trim();
-                    } else if (chunk.search_text) {
-                        fullText = chunk.search_text.trim();
-                    } else if (chunk.content) {
-                        fullText = chunk.content.trim();
+                    if (chunkHighlight) {
+                        chunkHighlight.clear();
+                    } else {
+                        currentHighlights.forEach(span => span.classList.remove('highlight'));
+                        currentHighlights.clear();
                     }
                     
-                    if (!fullText) {
-                        console.log('No text content found for chunk:', chunk);
-                        return;
-                    }
+                    // Word sequences are precomputed in Python when the chunk map is built
+                    const firstWords = chunk.first_words;
+                    const lastWords = chunk.last_words;
                     
-                    // Extract first 5 and last 5 words from the chunk
-                    const words = fullText.split(/\\s+/).filter(word => word.length > 0);
-                    if (words.length < 3) {
-                        console.log('Text too short for reliable highlighting:', words.length, 'words');
+                    if (!firstWords) {
+                        console.log('Text too short for reliable highlighting:', chunkId);
                         showFallbackHighlight(chunk);
                         return;
                     }
                     
-                    const firstWords = words.slice(0, Math.min(5, words.length)).join(' ').toLowerCase();
-                    const lastWords = words.slice(-Math.min(5, words.length)).join(' ').toLowerCase();
-                    
                     console.log('First 5 words:', firstWords);
                     console.log('Last 5 words:', lastWords);
                     
-                    // Find spans containing the first and last words
-                    let startSpan = null;
-                    let endSpan = null;
-                    let inHighlightRegion = false;
-                    
-                    // Build continuous text from spans to match against
-                    let continuousText = '';
-                    let spanTextMap = [];
-                    
-                    spans.forEach((span, index) => {
-                        const spanText = span.textContent;
-                        spanTextMap.push({
-                            span: span,
-                            text: spanText,
-                            startIndex: continuousText.length,
-                            endIndex: continuousText.length + spanText.length
-                        });
-                        continuousText += spanText + ' ';
-                    });
-                    
-                    const continuousTextLower = continuousText.toLowerCase();
+                    // Continuous page text to match against, built once per rendered page
+                    if (pageTextCache.pageNum !== pageNum) {
+                        buildPageTextCache(pageNum);
+                    }
+                    const spanTextMap = pageTextCache.map;
                     
                     // Find the positions of first and last word sequences
-                    let startPos = continuousTextLower.indexOf(firstWords);
-                    let endPos = continuousTextLower.lastIndexOf(lastWords);
+                    const startMatch = findPhrase(firstWords, false);
+                    const endMatch = findPhrase(lastWords, true);
+                    let startPos = startMatch ? startMatch.start : -1;
+                    let endPos = endMatch ? endMatch.start : -1;
                     
                     // If exact match fails, try partial matches
                     if (startPos === -1) {
                         // Try first 3 words, then 2, then 1
-                        for (let i = Math.min(3, words.length); i >= 1; i--) {
-                            const partialFirst = words.slice(0, i).join(' ').toLowerCase();
-                            startPos = continuousTextLower.indexOf(partialFirst);
-                            if (startPos !== -1) {
-                                console.log('Found partial first match with', i, 'words:', partialFirst);
+                        const firstList = firstWords.split(' ');
+                        for (let i = 3; i >= 1; i--) {
+                            const partialFirst = firstList.slice(0, i).join(' ');
+                            const match = findPhrase(partialFirst, false);
+                            if (match) {
+                                startPos = match.start;
+                                console.log('Found partial first match:', partialFirst);
                                 break;
                             }
                         }
@@ -210,12 +367,13 @@ class StandalonePDFViewer:
                     
                     if (endPos === -1 || endPos <= startPos) {
                         // Try last 3 words, then 2, then 1
-                        for (let i = Math.min(3, words.length); i >= 1; i--) {
-                            const partialLast = words.slice(-i).join(' ').toLowerCase();
-                            const tempPos = continuousTextLower.lastIndexOf(partialLast);
-                            if (tempPos !== -1 && tempPos > startPos) {
-                                endPos = tempPos + partialLast.length;
-                                console.log('Found partial last match with', i, 'words:', partialLast);
+                        const lastList = lastWords.split(' ');
+                        for (let i = 3; i >= 1; i--) {
+                            const partialLast = lastList.slice(-i).join(' ');
+                            const match = findPhrase(partialLast, true);
+                            if (match && match.start > startPos) {
+                                endPos = match.end;
+                                console.log('Found partial last match:', partialLast);
                                 break;
                             }
                         }
@@ -233,29 +391,33 @@ class StandalonePDFViewer:
                     let highlightedCount = 0;
                     let firstHighlight = null;
                     
+                    let lastHighlight = null;
+                    
                     spanTextMap.forEach(spanInfo => {
                         // Check if this span overlaps with our highlight region
                         if (spanInfo.endIndex > startPos && spanInfo.startIndex < endPos) {
-                            spanInfo.span.classList.add('highlight');
-                            spanInfo.span.style.background = 'rgba(255, 193, 7, 0.7)';
-                            spanInfo.span.style.border = '2px solid #ff9800';
-                            spanInfo.span.style.borderRadius = '6px';
-                            spanInfo.span.style.boxShadow = '0 0 10px rgba(255, 152, 0, 0.5)';
-                            spanInfo.span.style.display = 'inline-block';
-                            spanInfo.span.style.padding = '2px 4px';
-                            spanInfo.span.style.marginLeft = '-2px'; // or use translateX
-
+                            if (!chunkHighlight) {
+                                spanInfo.span.classList.add('highlight');
+                                currentHighlights.add(spanInfo.span);
+                            }
                             
                             highlightedCount++;
                             
                             if (!firstHighlight) {
                                 firstHighlight = spanInfo.span;
                             }
-                            
-                            console.log('Highlighted span:', spanInfo.text.substring(0, 50));
+                            lastHighlight = spanInfo.span;
                         }
                     });
                     
+                    // Paint the whole region as one range: no style writes on the spans, so no reflow
+                    if (chunkHighlight && firstHighlight) {
+                        const range = document.createRange();
+                        range.setStartBefore(firstHighlight);
+                        range.setEndAfter(lastHighlight);
+                        chunkHighlight.add(range);
+                    }
+                    
                     console.log('Total highlights created:', highlightedCount);
                     
                     // Scroll to first highlight
@@ -313,7 +475,9 @@ class StandalonePDFViewer:
         <html>
         <head>
             <title>Document Viewer</title>
-            <script src="https://cdnjs.cloudflare.com/ajax/libs/pdf.js/3.11.174/pdf.min.js"></script>
+            <!-- Fetch the worker in parallel with the library instead of after it has executed -->
+            <link rel="prefetch" href="{PDFJS_BASE_URL}/pdf.worker.min.js">
+            <script src="{PDFJS_BASE_URL}/pdf.min.js"></script>
             <style>
                 body {{ margin: 0; font-family: Arial; display: flex; height: 100vh; }}
                 .sidebar {{ width: 300px; background: white; border-right: 1px solid #ddd; padding: 15px; overflow-y: auto; }}
@@ -323,7 +487,8 @@ class StandalonePDFViewer:
                 #pdf-canvas {{ border: 1px solid #ddd; background: white; box-shadow: 0 4px 8px rgba(0,0,0,0.1); }}
                 .textLayer {{ position: absolute; left: 0; top: 0; right: 0; bottom: 0; overflow: hidden; opacity: 0.2; line-height: 1.0; }}
                 .textLayer > span {{ color: transparent; position: absolute; white-space: pre; cursor: text; transform-origin: 0% 0%; }}
-                .textLayer .highlight {{ background: rgba(255, 193, 7, 0.6) !important; border: 2px solid #ff9800 !important; border-radius: 4px !important; color: transparent !important; }}
+                ::highlight(chunk-hl) {{ background-color: rgba(255, 193, 7, 0.7); }}
+                .textLayer .highlight {{ background: rgba(255, 193, 7, 0.7) !important; border: 2px solid #ff9800 !important; border-radius: 6px !important; box-shadow: 0 0 10px rgba(255, 152, 0, 0.5); color: transparent !important; }}
                 .chunk-item {{ background: #f8f9fa; border: 1px solid #e9ecef; border-radius: 6px; padding: 12px; margin-bottom: 10px; cursor: pointer; transition: all 0.2s; }}
                 .chunk-item:hover {{ background: #e3f2fd; border-color: #2196f3; }}
                 .chunk-item.active {{ background: #fff3e0; border-color: #ff9800; }}
@@ -342,6 +507,9 @@ class StandalonePDFViewer:
             <div class="sidebar">
                 <div style="font-weight: bold; margin-bottom: 15px; color: #333;">📚 Citation Sources</div>
                 <div id="chunk-list"></div>
+                <template id="chunk-template">
+                    <div class="chunk-item"><div class="chunk-header"></div><div class="chunk-page"></div><div class="chunk-preview"></div></div>
+                </template>
             </div>
             
             <div class="main-viewer">
@@ -366,7 +534,7 @@ class StandalonePDFViewer:
             </div>
             
             <script>
-                pdfjsLib.GlobalWorkerOptions.workerSrc = 'https://cdnjs.cloudflare.com/ajax/libs/pdf.js/3.11.174/pdf.worker.min.js';
+                pdfjsLib.GlobalWorkerOptions.workerSrc = '{PDFJS_BASE_URL}/pdf.worker.min.js';
                 
                 let pdfDoc = null;
                 let pageNum = 1;
@@ -376,9 +544,20 @@ class StandalonePDFViewer:
                 let chunkMap = {chunk_map_json};
                 let activeChunk = '{active_chunk}';
                 
-                const pdfData = 'data:application/pdf;base64,{pdf_data}';
+                // Resolve against the Streamlit page so the srcdoc iframe can fetch it
+                const pdfUrl = new URL('{pdf_url}', document.baseURI).href;
                 
-                pdfjsLib.getDocument(pdfData).promise.then(function(pdfDoc_) {{
+                // Fetch the file in 64 KB range requests and only for the pages that are
+                // shown, instead of downloading the whole document before the first render.
+                // Streaming stays off: with it on, pdf.js keeps reading the full-file
+                // response alongside the ranges. Without it, the initial request is
+                // cancelled as soon as the server confirms range support.
+                pdfjsLib.getDocument({{
+                    url: pdfUrl,
+                    rangeChunkSize: 65536,
+                    disableAutoFetch: true,
+                    disableStream: true
+                }}).promise.then(function(pdfDoc_) {{
                     pdfDoc = pdfDoc_;
                     document.getElementById('page-count').textContent = 'of ' + pdfDoc.numPages;
                     document.getElementById('page-input').max = pdfDoc.numPages;
@@ -389,27 +568,29 @@ class StandalonePDFViewer:
                     createChunkList();
                     
                     if (activeChunk) {{
-                        setTimeout(() => navigateToChunk(activeChunk), 1000);
+                        navigateToChunk(activeChunk);
                     }}
                 }});
                 
                 function createChunkList() {{
                     const chunkList = document.getElementById('chunk-list');
+                    const template = document.getElementById('chunk-template').content;
                     
+                    // Clone the template per chunk and attach them all with one append
+                    const fragment = document.createDocumentFragment();
                     Object.keys(chunkMap).forEach(chunkId => {{
                         const chunk = chunkMap[chunkId];
-                        const chunkItem = document.createElement('div');
-                        chunkItem.className = 'chunk-item';
+                        const chunkItem = template.firstElementChild.cloneNode(true);
                         chunkItem.id = 'sidebar-' + chunkId;
                         chunkItem.onclick = () => navigateToChunk(chunkId);
                         
-                        chunkItem.innerHTML = 
-                            '<div class="chunk-header">Source ' + chunk.source_num + '</div>' +
-                            '<div class="chunk-page">Page ' + chunk.page + '</div>' +
-                            '<div class="chunk-preview">' + chunk.content + '</div>';
+                        chunkItem.querySelector('.chunk-header').textContent = 'Source ' + chunk.source_num;
+                        chunkItem.querySelector('.chunk-page').textContent = 'Page ' + chunk.page;
+                        chunkItem.querySelector('.chunk-preview').textContent = chunk.preview;
                         
-                        chunkList.appendChild(chunkItem);
+                        fragment.appendChild(chunkItem);
                     }});
+                    chunkList.appendChild(fragment);
                 }}
                 
                 function navigateToChunk(chunkId) {{
@@ -427,13 +608,85 @@ class StandalonePDFViewer:
                         renderPage(pageNum);
                     }}
                     
-                    setTimeout(() => highlightChunk(chunkId), 500);
+                    // Highlight as soon as the page's text layer exists, unless the user moved on
+                    whenTextLayerReady().then(() => {{
+                        if (activeChunk === chunkId && pageNum === chunk.page) highlightChunk(chunkId);
+                    }});
                 }}
                 
                 {highlight_js}
                 
+                // Rendered pages keyed by "page:scale" (Map keeps insertion order, so it doubles as an LRU)
+                const PAGE_CACHE_SIZE = 8;
+                const pageCache = new Map();
+                let renderedScale = scale;
+                let zoomTimer = null;
+                
+                function cachePage(key, entry) {{
+                    const previous = pageCache.get(key);
+                    if (previous && previous !== entry) {{
+                        previous.bitmap.close();
+                    }}
+                    pageCache.delete(key);
+                    pageCache.set(key, entry);
+                    if (pageCache.size > PAGE_CACHE_SIZE) {{
+                        const oldestKey = pageCache.keys().next().value;
+                        pageCache.get(oldestKey).bitmap.close();
+                        pageCache.delete(oldestKey);
+                    }}
+                }}
+                
+                function drawTextLayer(num, textContent, viewport) {{
+                    // Clear existing text layer
+                    pageTextCache.pageNum = -1;
+                    const textLayer = document.getElementById('text-layer');
+                    textLayer.innerHTML = '';
+                    textLayer.style.left = canvas.offsetLeft + 'px';
+                    textLayer.style.top = canvas.offsetTop + 'px';
+                    textLayer.style.height = canvas.height + 'px';
+                    textLayer.style.width = canvas.width + 'px';
+                    
+                    // Render text layer; the returned promise resolves once it can be searched
+                    return pdfjsLib.renderTextLayer({{
+                        textContent: textContent,
+                        container: textLayer,
+                        viewport: viewport,
+                        textDivs: []
+                    }}).promise.then(() => {{ if (num === pageNum) buildPageTextCache(num); }});
+                }}
+                
+                // Only the latest renderPage call may paint: older in-flight renders are cancelled
+                // and their callbacks see a stale sequence number
+                let currentRenderTask = null;
+                let renderSeq = 0;
+                let textLayerReady = Promise.resolve();
+                let pageInputTimer = null;
+                
                 function renderPage(num) {{
-                    pdfDoc.getPage(num).then(function(page) {{
+                    const key = num + ':' + scale;
+                    const seq = ++renderSeq;
+                    if (currentRenderTask) {{
+                        currentRenderTask.cancel();
+                        currentRenderTask = null;
+                    }}
+                    renderedScale = scale;
+                    document.getElementById('pdf-container').style.transform = '';
+                    document.getElementById('page-input').value = num;
+                    
+                    // Previously visited page at this zoom level: blit it instead of re-rasterizing
+                    const cached = pageCache.get(key);
+                    if (cached) {{
+                        cachePage(key, cached);
+                        canvas.width = cached.bitmap.width;
+                        canvas.height = cached.bitmap.height;
+                        ctx.drawImage(cached.bitmap, 0, 0);
+                        textLayerReady = drawTextLayer(num, cached.textContent, cached.viewport);
+                        schedulePrefetch(num);
+                        return textLayerReady;
+                    }}
+                    
+                    textLayerReady = pdfDoc.getPage(num).then(function(page) {{
+                        if (seq !== renderSeq) return;
                         const viewport = page.getViewport({{scale: scale}});
                         canvas.height = viewport.height;
                         canvas.width = viewport.width;
@@ -444,41 +697,85 @@ class StandalonePDFViewer:
                             viewport: viewport
                         }};
                         
-                        page.render(renderContext).promise.then(function() {{
-                            // Clear existing text layer
-                            const textLayer = document.getElementById('text-layer');
-                            textLayer.innerHTML = '';
-                            textLayer.style.left = canvas.offsetLeft + 'px';
-                            textLayer.style.top = canvas.offsetTop + 'px';
-                            textLayer.style.height = canvas.height + 'px';
-                            textLayer.style.width = canvas.width + 'px';
-                            
-                            // Render text layer
-                            page.getTextContent().then(function(textContent) {{
-                                pdfjsLib.renderTextLayer({{
-                                    textContent: textContent,
-                                    container: textLayer,
-                                    viewport: viewport,
-                                    textDivs: []
-                                }});
-                            }});
+                        const renderTask = page.render(renderContext);
+                        currentRenderTask = renderTask;
+                        return renderTask.promise.then(function() {{
+                            if (currentRenderTask === renderTask) currentRenderTask = null;
+                            return page.getTextContent();
+                        }}).then(function(textContent) {{
+                            if (seq !== renderSeq) return;
+                            const ready = drawTextLayer(num, textContent, viewport);
+                            createImageBitmap(canvas).then(bitmap => cachePage(key, {{bitmap, textContent, viewport}}));
+                            schedulePrefetch(num);
+                            return ready;
                         }});
+                    }}).catch(function(error) {{
+                        if (error.name !== 'RenderingCancelledException') console.error(error);
                     }});
+                    return textLayerReady;
+                }}
+                
+                // Resolves once the text layer of the most recent renderPage call is ready,
+                // following along if another render supersedes the one being waited on
+                function whenTextLayerReady() {{
+                    const pending = textLayerReady;
+                    return pending.then(() => pending === textLayerReady ? undefined : whenTextLayerReady());
+                }}
+                
+                // Pre-render the neighbouring pages into the page cache while the browser is idle,
+                // so Prev/Next and chunk navigation to them only need a blit
+                const prefetching = new Set();
+                
+                function schedulePrefetch(num) {{
+                    const whenIdle = window.requestIdleCallback || (callback => setTimeout(callback, 200));
+                    whenIdle(() => {{
+                        prefetchPage(num + 1);
+                        prefetchPage(num - 1);
+                    }});
+                }}
+                
+                function prefetchPage(num) {{
+                    const key = num + ':' + scale;
+                    if (num < 1 || num > pdfDoc.numPages || pageCache.has(key) || prefetching.has(key)) return;
+                    prefetching.add(key);
                     
-                    document.getElementById('page-input').value = num;
+                    const renderScale = scale;
+                    pdfDoc.getPage(num).then(function(page) {{
+                        const viewport = page.getViewport({{scale: renderScale}});
+                        const offscreen = document.createElement('canvas');
+                        offscreen.width = viewport.width;
+                        offscreen.height = viewport.height;
+                        
+                        return page.render({{canvasContext: offscreen.getContext('2d'), viewport: viewport}}).promise
+                            .then(() => Promise.all([page.getTextContent(), createImageBitmap(offscreen)]))
+                            .then(([textContent, bitmap]) => cachePage(key, {{bitmap, textContent, viewport}}));
+                    }}).finally(() => prefetching.delete(key));
                 }}
                 
                 function prevPage() {{ if (pageNum > 1) {{ pageNum--; renderPage(pageNum); }} }}
                 function nextPage() {{ if (pageNum < pdfDoc.numPages) {{ pageNum++; renderPage(pageNum); }} }}
                 function goToPage() {{
-                    const inputPage = parseInt(document.getElementById('page-input').value);
-                    if (inputPage >= 1 && inputPage <= pdfDoc.numPages) {{
-                        pageNum = inputPage;
-                        renderPage(pageNum);
-                    }}
+                    // Stepping through the number input fires change per click; render once it settles
+                    clearTimeout(pageInputTimer);
+                    pageInputTimer = setTimeout(() => {{
+                        const inputPage = parseInt(document.getElementById('page-input').value);
+                        if (inputPage >= 1 && inputPage <= pdfDoc.numPages) {{
+                            pageNum = inputPage;
+                            renderPage(pageNum);
+                        }}
+                    }}, 150);
+                }}
+                function setZoom(newScale) {{
+                    // Preview the zoom instantly with a CSS transform and re-render once clicks settle
+                    scale = Math.round(newScale * 10) / 10;
+                    const container = document.getElementById('pdf-container');
+                    container.style.transformOrigin = 'top center';
+                    container.style.transform = 'scale(' + (scale / renderedScale) + ')';
+                    clearTimeout(zoomTimer);
+                    zoomTimer = setTimeout(() => renderPage(pageNum), 250);
                 }}
-                function zoomIn() {{ scale += 0.2; renderPage(pageNum); }}
-                function zoomOut() {{ if (scale > 0.4) {{ scale -= 0.2; renderPage(pageNum); }} }}
+                function zoomIn() {{ setZoom(scale + 0.2); }}
+                function zoomOut() {{ if (scale > 0.4) {{ setZoom(scale - 0.2); }} }}
             </script>
         </body>
         </html>
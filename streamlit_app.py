@@ -1,13 +1,44 @@
+import html
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
 import streamlit as st
-from processing import load_documents, split_documents, add_to_chroma, clear_database
-from query_data import query_rag
-import json
-import urllib.parse
+from document_service import dump_json, load_json, store_viewer_payload
+
+# processing and query_data pull in LangChain, Chroma and the embedding model, so they
+# are imported where first used rather than here, letting the page render before they load
 
 st.set_page_config(page_title="RAG Pipeline App", page_icon="📚")
 
+CITATION_RE = re.compile(r'\[Source (\d+)\]')
+
+# Line breaks left in tooltip text after paragraph breaks are turned into bullets
+TOOLTIP_LINE_BREAKS = str.maketrans('\n\r', '  ')
+
+# Number of most recent chat messages rendered on each rerun, and how many more
+# each "Load older" click adds
+HISTORY_WINDOW = 30
+HISTORY_PAGE = 20
+
+# Chat history is persisted here, per session id (the ?sid= URL parameter), so a
+# browser refresh keeps the conversation
+CHAT_DB_PATH = "chat_history.db"
+
+# Streamed responses are redrawn at most every 50 ms and only once 8+ new characters arrived
+STREAM_UPDATE_INTERVAL = 0.05
+STREAM_UPDATE_MIN_CHARS = 8
+
+# While an ingest runs in the background, the page reruns this often to refresh its status
+INGEST_POLL_INTERVAL = 0.5
+
 # Custom CSS for citations with chunk navigation
-st.markdown("""
+_CSS = """
 <style>
     .citation-clickable {
         background-color: #e6f3ff;
@@ -36,6 +67,11 @@ st.markdown("""
         display: inline-block;
     }
 
+    /* Citations in answers show a tooltip rather than navigating */
+    .tooltip.citation-clickable {
+        cursor: help;
+    }
+
     /* Tooltip text */
     .tooltip .tooltiptext {
         visibility: hidden;
@@ -81,6 +117,23 @@ st.markdown("""
         opacity: 1;
     }
 
+    /* Per-file citation list in the sources section */
+    .source-table {
+        width: 100%;
+        border-collapse: collapse;
+        border: none;
+    }
+
+    .source-table td {
+        border: none;
+        padding: 4px 0;
+    }
+
+    .source-table td.source-action {
+        text-align: right;
+        white-space: nowrap;
+    }
+
     /* Responsive adjustments */
     @media (max-width: 768px) {
         .tooltip .tooltiptext {
@@ -126,40 +179,109 @@ st.markdown("""
         font-weight: bold;
     }
 </style>
+"""
 
-<script>
-// Global variable to track currently displayed document viewer
-let currentDocumentViewer = null;
+# The stylesheet never changes, so strip its comments and whitespace once at import
+_CSS = re.sub(r'/\*.*?\*/', '', _CSS, flags=re.DOTALL)
+_CSS = re.sub(r'\s*([{};,])\s*', r'\1', re.sub(r'\s+', ' ', _CSS))
+_CSS = re.sub(r':\s+', ':', _CSS).strip()
 
-// Function to navigate to chunk in PDF viewer
-function navigateToChunk(sourceNum) {
-    // Find the iframe containing the PDF viewer
-    const pdfViewerIframes = document.querySelectorAll('iframe[title*="stIFrame"]');
-    
-    pdfViewerIframes.forEach(iframe => {
-        try {
-            // Send message to PDF viewer to navigate to chunk
-            iframe.contentWindow.postMessage({
-                type: 'navigateToChunk',
-                chunkId: 'chunk-' + sourceNum
-            }, '*');
-        } catch (e) {
-            // Cross-origin restrictions, but message should still get through
+# Document opening handler with highlighting (rendered in a zero-height component below)
+_OPEN_DOCUMENT_SCRIPT = """
+<script>
+function openDocument(filename, filepath, page, highlightText, fullText) {
+    try {
+        // Store the highlight information for potential use
+        if (highlightText) {
+            console.log('Opening document with highlight:', highlightText);
+            sessionStorage.setItem('highlightText', highlightText);
+            sessionStorage.setItem('fullText', fullText);
+        }
+        
+        // Try different methods to open the document with highlighting
+        let fileUrl = 'file:///' + filepath.replace(/\\\\/g, '/') + '#page=' + page;
+        
+        // If we have text to highlight, try to use PDF.js search functionality
+        if (highlightText) {
+            // Try PDF.js viewer URL format with search
+            const searchText = encodeURIComponent(highlightText.substring(0, 50));
+            const pdfJsUrl = fileUrl + '&search=' + searchText;
+            
+            // Method 1: Try to open with PDF.js search
+            let newWindow = window.open(pdfJsUrl, '_blank');
+            
+            // Method 2: If that fails, try standard URL
+            if (!newWindow || newWindow.closed || typeof newWindow.closed == 'undefined') {
+                newWindow = window.open(fileUrl, '_blank');
+            }
+            
+            // Method 3: If that also fails, try creating a temporary link
+            if (!newWindow || newWindow.closed || typeof newWindow.closed == 'undefined') {
+                const link = document.createElement('a');
+                link.href = fileUrl;
+                link.target = '_blank';
+                link.style.display = 'none';
+                document.body.appendChild(link);
+                link.click();
+                document.body.removeChild(link);
+            }
+            
+            // Show user notification about the highlighted text
+            setTimeout(() => {
+                if (confirm('Document opened. The highlighted text is: "' + highlightText + '..." \\n\\nClick OK to copy the full text to clipboard for easy finding.')) {
+                    navigator.clipboard.writeText(fullText).then(() => {
+                        alert('Full text copied to clipboard! You can use Ctrl+F to search for it in the PDF.');
+                    }).catch(() => {
+                        prompt('Full text to search for (copy this):', fullText);
+                    });
+                }
+            }, 1000);
+            
+        } else {
+            // Standard document opening without highlighting
+            const newWindow = window.open(fileUrl, '_blank');
+            
+            if (!newWindow || newWindow.closed || typeof newWindow.closed == 'undefined') {
+                const link = document.createElement('a');
+                link.href = fileUrl;
+                link.target = '_blank';
+                link.style.display = 'none';
+                document.body.appendChild(link);
+                link.click();
+                document.body.removeChild(link);
+            }
         }
-    });
+        
+    } catch (error) {
+        console.error('Could not open document:', error);
+        alert('Could not open document: ' + filename + '. Please check if the file exists and your browser allows file:// URLs.');
+    }
 }
 
-// Add event listener for citation clicks
-document.addEventListener('click', function(event) {
-    if (event.target.classList.contains('citation-clickable')) {
-        const sourceNum = event.target.getAttribute('data-source-num');
-        if (sourceNum) {
-            navigateToChunk(sourceNum);
-        }
+function openDocumentRequest(doc) {
+    openDocument(doc.filename, doc.filepath, doc.page, doc.highlightText, doc.fullText);
+}
+
+// Listen for document opening events, either dispatched directly or posted as
+// {type: 'openDocument', payload: {...}} messages. Messages are only accepted from
+// this frame or the Streamlit page hosting it, never from other windows or origins.
+window.addEventListener('openDocument', function(event) {
+    openDocumentRequest(event.detail);
+});
+window.addEventListener('message', function(event) {
+    if (event.source !== window && event.source !== window.parent) {
+        return;
+    }
+    if (event.data && event.data.type === 'openDocument') {
+        openDocumentRequest(event.data.payload);
     }
 });
 </script>
-""", unsafe_allow_html=True)
+"""
+
+# Streamlit drops any element a rerun does not emit again, so this still runs every rerun.
+# Only the styles are sent: scripts inside st.markdown are never executed by the browser.
+st.markdown(_CSS, unsafe_allow_html=True)
 
 st.title("RAG Pipeline")
 
@@ -173,67 +295,241 @@ def format_response_with_chunk_navigation(response_text: str, citations: list) -
     """
     Format response text with clickable citations and tooltips.
     """
-    import re
-    
-    formatted_response = response_text
-    
-    # Create a mapping of citation numbers to citation data
-    citation_data = {}
+    # Build the tooltip span for each citation number (no click navigation needed here)
+    citation_spans = {}
     for citation in citations:
-        citation_data[citation["source_num"]] = citation
-    
-    # Replace citations with tooltip-enabled spans (no click navigation needed here)
-    for source_num, citation in citation_data.items():
+        source_num = citation["source_num"]
+        
         # Format tooltip text
-        formatted_tooltip = (citation["tooltip_text"]
-                           .replace('\n\n', ' • ')  # Paragraph breaks become bullet points
-                           .replace('\n', ' ')       # Single line breaks become spaces
-                           .replace('\r', ' '))
+        # (paragraph breaks become bullet points, remaining line breaks become spaces)
+        formatted_tooltip = citation["tooltip_text"].replace('\n\n', ' • ').translate(TOOLTIP_LINE_BREAKS)
         
-        # Escape quotes for HTML attributes
-        escaped_tooltip = (formatted_tooltip
-                          .replace('"', '&quot;')
-                          .replace("'", "&#39;"))
+        # Escape for HTML (quotes, and also <, > and & that could break the markup)
+        escaped_tooltip = html.escape(formatted_tooltip, quote=True)
         
         # Create citation with tooltip (navigation will be via buttons in sources section)
-        citation_html = f'''<span class="tooltip citation-clickable" style="cursor: help;">[Source {source_num}]<span class="tooltiptext">{escaped_tooltip}</span></span>'''
-        
-        # Replace [Source X] with citation
-        formatted_response = re.sub(
-            f'\\[Source {source_num}\\]',
-            citation_html,
-            formatted_response
+        citation_spans[source_num] = f'<span class="tooltip citation-clickable">[Source {source_num}]<span class="tooltiptext">{escaped_tooltip}</span></span>'
+    
+    # Replace every [Source X] in a single pass; numbers without citation data are left as-is
+    return CITATION_RE.sub(
+        lambda match: citation_spans.get(int(match.group(1)), match.group(0)),
+        response_text
+    )
+
+def debounce_stream(stream: Iterator[str]) -> Iterator[str]:
+    """
+    Regroup a token stream into larger pieces so the UI is redrawn a few dozen times
+    per second instead of once per token.
+    """
+    buffer = []
+    buffered_chars = 0
+    last_flush = time.monotonic()
+    for token in stream:
+        buffer.append(token)
+        buffered_chars += len(token)
+        now = time.monotonic()
+        if now - last_flush >= STREAM_UPDATE_INTERVAL and buffered_chars >= STREAM_UPDATE_MIN_CHARS:
+            yield "".join(buffer)
+            buffer.clear()
+            buffered_chars = 0
+            last_flush = now
+    if buffer:
+        yield "".join(buffer)
+
+def get_formatted(message: dict) -> str:
+    """
+    Return the message's response formatted with citation tooltips.
+    The HTML is kept on the message, so reruns don't format the same history again.
+    """
+    fmt_key = (len(message["content"]), len(message["citations"]))
+    if message.get("_fmt_key") != fmt_key:
+        message["_formatted_html"] = format_response_with_chunk_navigation(
+            message["content"],
+            message["citations"]
         )
+        message["_fmt_key"] = fmt_key
+    return message["_formatted_html"]
+
+def ingest_documents(progress: dict) -> None:
+    """
+    Load, split and store the PDFs that are new or changed since the last ingest
+    (runs on the ingestion thread). Batch progress is written to the progress dict
+    for the script thread to display.
+    """
+    from processing import add_to_chroma, find_changed_documents, load_documents, load_manifest, save_manifest, split_documents
+    from query_data import clear_response_cache, get_db
+    
+    changed_paths, manifest = find_changed_documents(load_manifest())
+    progress["files"] = len(changed_paths)
+    if not changed_paths:
+        return
+    
+    def report(added: int, total: int) -> None:
+        progress["added"], progress["total"] = added, total
     
-    return formatted_response
+    # Write through the Chroma handle the chat queries already hold open
+    chunks = split_documents(load_documents(changed_paths))
+    add_to_chroma(chunks, progress_callback=report, db=get_db(), replace_sources=changed_paths)
+    save_manifest(manifest)
+    # Cached answers predate the new documents
+    clear_response_cache()
+
+@st.cache_resource
+def get_chat_db() -> tuple:
+    """Shared SQLite connection for chat history, with the lock that serializes its use."""
+    connection = sqlite3.connect(CHAT_DB_PATH, check_same_thread=False, isolation_level=None)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, sid TEXT NOT NULL, role TEXT NOT NULL, "
+        "content TEXT NOT NULL, citations TEXT, enhanced_citations TEXT, formatted TEXT)"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS messages_sid ON messages (sid, id)")
+    return connection, threading.Lock()
+
+def save_message(sid: str, message: dict) -> None:
+    """Append a chat message to the session's persisted history."""
+    connection, lock = get_chat_db()
+    citations = message.get("citations")
+    enhanced_citations = message.get("enhanced_citations")
+    with lock:
+        connection.execute(
+            "INSERT INTO messages (sid, role, content, citations, enhanced_citations, formatted) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                sid,
+                message["role"],
+                message["content"],
+                dump_json(citations).decode("utf-8") if citations is not None else None,
+                dump_json(enhanced_citations).decode("utf-8") if enhanced_citations is not None else None,
+                message.get("_formatted_html"),
+            )
+        )
 
-def create_document_viewer_url(filename: str, citations: list, active_source: int = None) -> str:
-    """Create URL for standalone document viewer with chunk data."""
-    # Prepare chunk data for URL
-    chunk_data = []
-    for citation in citations:
-        if citation.get('filename') == filename:
-            chunk_data.append({
-                'source_num': citation.get('source_num'),
-                'page': citation.get('page'),
-                'tooltip_text': citation.get('tooltip_text', '')
-            })
+def load_recent_messages(sid: str, limit: int = HISTORY_WINDOW) -> list:
+    """The session's last `limit` persisted messages, oldest first."""
+    connection, lock = get_chat_db()
+    with lock:
+        rows = connection.execute(
+            "SELECT role, content, citations, enhanced_citations, formatted FROM messages WHERE sid = ? ORDER BY id DESC LIMIT ?",
+            (sid, limit)
+        ).fetchall()
     
-    # Encode data for URL
-    chunks_encoded = urllib.parse.quote(json.dumps(chunk_data))
+    messages = []
+    for role, content, citations, enhanced_citations, formatted in reversed(rows):
+        message = {"role": role, "content": content}
+        if citations is not None:
+            message["citations"] = load_json(citations)
+            if enhanced_citations is not None:
+                message["enhanced_citations"] = load_json(enhanced_citations)
+            if formatted is not None:
+                message["_formatted_html"] = formatted
+                message["_fmt_key"] = (len(content), len(message["citations"]))
+        messages.append(message)
+    return messages
+
+def add_message(message: dict) -> None:
+    """
+    Append a message to the chat, persisting it and keeping only the visible window in
+    memory; older messages stay in SQLite and come back through "Load older".
+    """
+    messages = st.session_state.messages
+    messages.append(message)
+    save_message(st.session_state.sid, message)
+    del messages[:-st.session_state.visible_window]
+
+def count_messages(sid: str) -> dict:
+    """Number of persisted messages per role for the session."""
+    connection, lock = get_chat_db()
+    with lock:
+        return dict(connection.execute(
+            "SELECT role, COUNT(*) FROM messages WHERE sid = ? GROUP BY role", (sid,)
+        ).fetchall())
+
+def clear_messages(sid: str) -> None:
+    connection, lock = get_chat_db()
+    with lock:
+        connection.execute("DELETE FROM messages WHERE sid = ?", (sid,))
+
+# Expires well within VIEWER_PAYLOAD_MAX_AGE_SECONDS, so payloads still linked from the
+# chat are stored (and marked as used) again before they could be pruned
+@st.cache_data(show_spinner=False, max_entries=1024, ttl=3600)
+def _viewer_base_url(filename: str, chunks: tuple) -> str:
+    """
+    Store the chunk data server-side and return the viewer URL carrying its key.
+    chunks holds (source_num, page, tooltip_text) per citation, so reruns reuse the URL.
+    """
+    viewer_key = store_viewer_payload([
+        {'source_num': source_num, 'page': page, 'tooltip_text': tooltip_text}
+        for source_num, page, tooltip_text in chunks
+    ])
     
     # Create URL for standalone viewer (runs on port 8503)
     base_url = "http://localhost:8503"
-    viewer_url = f"{base_url}/?file={filename}&chunks={chunks_encoded}"
+    return f"{base_url}/?file={filename}&key={viewer_key}"
+
+def create_document_viewer_url(filename: str, citations: list, active_source: int = None) -> str:
+    """Create URL for standalone document viewer with chunk data."""
+    viewer_url = _viewer_base_url(filename, tuple(
+        (citation.get('source_num'), citation.get('page'), citation.get('tooltip_text', ''))
+        for citation in citations
+        if citation.get('filename') == filename
+    ))
     
     if active_source:
         viewer_url += f"&active=chunk-{active_source}"
     
     return viewer_url
 
-# Initialize chat history in session state
+def render_sources(citations: list) -> None:
+    """Expandable list of an answer's sources, grouped by file, with document viewer links."""
+    # Group citations by filename for better organization
+    citations_by_file = defaultdict(list)
+    for citation in citations:
+        citations_by_file[citation.get('filename', 'Unknown')].append(citation)
+    
+    # The whole section is built as one HTML string and sent with a single markdown call
+    parts = []
+    for filename, file_citations in citations_by_file.items():
+        escaped_filename = html.escape(filename)
+        if filename.endswith('.pdf'):
+            parts.append(f'<p><b>📄 {escaped_filename}</b></p>')
+            
+            # Create a button to open the document viewer with all citations
+            viewer_url = create_document_viewer_url(filename, file_citations)
+            parts.append(f'<a href="{viewer_url}" target="_blank" style="text-decoration: none;"><button style="background: #2196f3; color: white; border: none; padding: 8px 16px; border-radius: 4px; cursor: pointer; margin-bottom: 10px;">🔍 Open Document Viewer</button></a>')
+            
+            # List the citations for this file as one table, each row with a button
+            # that opens the viewer focused on that citation
+            parts.append('<table class="source-table">')
+            parts.extend(
+                f'<tr><td>• <b>[Source {citation["source_num"]}]</b> Page {html.escape(str(citation["page"]))}</td>'
+                f'<td class="source-action"><a href="{viewer_url}&active=chunk-{citation["source_num"]}" target="_blank" style="text-decoration: none;"><button style="background: #ff9800; color: white; border: none; padding: 4px 8px; border-radius: 3px; cursor: pointer; font-size: 12px;">📍 Go to Source</button></a></td></tr>'
+                for citation in file_citations
+            )
+            parts.append('</table><hr>')
+        else:
+            # Non-PDF files are listed without viewer links
+            parts.extend(
+                f'<p>• <b>[Source {citation["source_num"]}]</b> {escaped_filename}, p. {html.escape(str(citation["page"]))}</p>'
+                for citation in file_citations
+            )
+    
+    with st.expander(f"📚 Sources ({len(citations)} cited)", expanded=False):
+        st.markdown("".join(parts), unsafe_allow_html=True)
+
+# Identify the chat session through the URL so a refresh finds its history again
+if "sid" not in st.session_state:
+    st.session_state.sid = st.query_params.get("sid") or uuid.uuid4().hex
+    st.query_params["sid"] = st.session_state.sid
+
+# Initialize chat history in session state; only the recent window is loaded from disk
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = load_recent_messages(st.session_state.sid)
+    
+    # Message counts for the sidebar stats, kept up to date as messages are appended
+    message_counts = count_messages(st.session_state.sid)
+    st.session_state.user_count = message_counts.get("user", 0)
+    st.session_state.assistant_count = message_counts.get("assistant", 0)
 
 # Section: Ingest PDFs into Vector Store
 with st.sidebar:
@@ -243,12 +539,35 @@ with st.sidebar:
     #     clear_database()
     #     st.success("Vector store database cleared!")
 
-    if st.button("Ingest PDFs to Vector Store"):
-        with st.spinner("⏳ Loading PDFs and updating vector store..."):
-            documents = load_documents()
-            chunks = split_documents(documents)
-            add_to_chroma(chunks)
-        st.success("Document ingestion complete!")
+    # Ingestion runs on a background thread so the chat stays usable meanwhile
+    if "ingest_executor" not in st.session_state:
+        st.session_state.ingest_executor = ThreadPoolExecutor(max_workers=1)
+    ingest_future = st.session_state.get("ingest_future")
+    ingest_running = False
+    
+    if st.button("Ingest PDFs to Vector Store", disabled=ingest_future is not None and not ingest_future.done()):
+        st.session_state.ingest_progress = {}
+        ingest_future = st.session_state.ingest_executor.submit(
+            ingest_documents, st.session_state.ingest_progress
+        )
+        st.session_state.ingest_future = ingest_future
+    
+    if ingest_future is not None:
+        if not ingest_future.done():
+            ingest_running = True
+            st.info("⏳ Loading PDFs and updating vector store in the background...")
+            progress = st.session_state.ingest_progress
+            if progress.get("total"):
+                st.progress(progress["added"] / progress["total"], text=f"{progress['added']}/{progress['total']} chunks added")
+        elif ingest_future.exception() is not None:
+            st.error(f"Document ingestion failed: {ingest_future.exception()}")
+            del st.session_state.ingest_future
+        elif st.session_state.ingest_progress.get("files") == 0:
+            st.success("No new or changed PDFs to ingest.")
+            del st.session_state.ingest_future
+        else:
+            st.success("Document ingestion complete!")
+            del st.session_state.ingest_future
     
     st.markdown("---")
     
@@ -256,7 +575,11 @@ with st.sidebar:
     st.header("💬 Chat Controls")
     if st.button("🗑️ Clear Chat History"):
         st.session_state.messages = []
-        st.rerun()
+        clear_messages(st.session_state.sid)
+        st.session_state.visible_window = HISTORY_WINDOW
+        st.session_state.user_count = 0
+        st.session_state.assistant_count = 0
+        # No st.rerun() needed: the history is rendered further down this same run
     
 
     
@@ -282,93 +605,8 @@ with st.sidebar:
     #         mime="text/markdown"
     #     )
 
-# Document opening handler with highlighting
-st.components.v1.html("""
-<script>
-function openDocument(filename, filepath, page, highlightText, fullText) {
-    try {
-        // Store the highlight information for potential use
-        if (highlightText) {
-            console.log('Opening document with highlight:', highlightText);
-            sessionStorage.setItem('highlightText', highlightText);
-            sessionStorage.setItem('fullText', fullText);
-        }
-        
-        // Try different methods to open the document with highlighting
-        let fileUrl = 'file:///' + filepath.replace(/\\/g, '/') + '#page=' + page;
-        
-        // If we have text to highlight, try to use PDF.js search functionality
-        if (highlightText) {
-            // Try PDF.js viewer URL format with search
-            const searchText = encodeURIComponent(highlightText.substring(0, 50));
-            const pdfJsUrl = fileUrl + '&search=' + searchText;
-            
-            // Method 1: Try to open with PDF.js search
-            let newWindow = window.open(pdfJsUrl, '_blank');
-            
-            // Method 2: If that fails, try standard URL
-            if (!newWindow || newWindow.closed || typeof newWindow.closed == 'undefined') {
-                newWindow = window.open(fileUrl, '_blank');
-            }
-            
-            // Method 3: If that also fails, try creating a temporary link
-            if (!newWindow || newWindow.closed || typeof newWindow.closed == 'undefined') {
-                const link = document.createElement('a');
-                link.href = fileUrl;
-                link.target = '_blank';
-                link.style.display = 'none';
-                document.body.appendChild(link);
-                link.click();
-                document.body.removeChild(link);
-            }
-            
-            // Show user notification about the highlighted text
-            setTimeout(() => {
-                if (confirm('Document opened. The highlighted text is: "' + highlightText + '..." \\n\\nClick OK to copy the full text to clipboard for easy finding.')) {
-                    navigator.clipboard.writeText(fullText).then(() => {
-                        alert('Full text copied to clipboard! You can use Ctrl+F to search for it in the PDF.');
-                    }).catch(() => {
-                        prompt('Full text to search for (copy this):', fullText);
-                    });
-                }
-            }, 1000);
-            
-        } else {
-            // Standard document opening without highlighting
-            const newWindow = window.open(fileUrl, '_blank');
-            
-            if (!newWindow || newWindow.closed || typeof newWindow.closed == 'undefined') {
-                const link = document.createElement('a');
-                link.href = fileUrl;
-                link.target = '_blank';
-                link.style.display = 'none';
-                document.body.appendChild(link);
-                link.click();
-                document.body.removeChild(link);
-            }
-        }
-        
-    } catch (error) {
-        console.error('Could not open document:', error);
-        alert('Could not open document: ' + filename + '. Please check if the file exists and your browser allows file:// URLs.');
-    }
-}
-
-// Listen for document opening events
-window.addEventListener('openDocument', function(event) {
-    const { filename, filepath, page, highlightText, fullText } = event.detail;
-    openDocument(filename, filepath, page, highlightText, fullText);
-});
-
-// Also check for any pending documents to open
-setInterval(function() {
-    if (window.documentsToOpen && window.documentsToOpen.length > 0) {
-        const doc = window.documentsToOpen.shift();
-        openDocument(doc.filename, doc.filepath, doc.page, doc.highlightText, doc.fullText);
-    }
-}, 100);
-</script>
-""", height=0)
+# Identical HTML on every rerun, so Streamlit keeps the existing iframe rather than reloading it
+st.components.v1.html(_OPEN_DOCUMENT_SCRIPT, height=0)
 
 # Main chat interface
 
@@ -376,63 +614,39 @@ setInterval(function() {
 # Display chat messages
 chat_container = st.container()
 with chat_container:
-    for msg_idx, message in enumerate(st.session_state.messages):
+    # Only the most recent messages are rendered; "Load older" pages further back,
+    # reading them from the persisted history once the loaded ones run out
+    visible_window = st.session_state.setdefault("visible_window", HISTORY_WINDOW)
+    total_messages = st.session_state.user_count + st.session_state.assistant_count
+    if total_messages > visible_window and st.button("⬆ Load older messages", key="load_older_messages"):
+        visible_window = st.session_state.visible_window = visible_window + HISTORY_PAGE
+        if len(st.session_state.messages) < min(visible_window, total_messages):
+            st.session_state.messages = load_recent_messages(st.session_state.sid, visible_window)
+    visible_messages = st.session_state.messages[-visible_window:]
+    
+    for message in visible_messages:
         if message["role"] == "user":
             with st.chat_message("user"):
                 st.write(message["content"])
         else:
             with st.chat_message("assistant"):
                 # Display response with clickable citations for chunk navigation
-                if message.get("citations"):
-                    response_with_navigation = format_response_with_chunk_navigation(
-                        message["content"], 
-                        message["citations"]
-                    )
-                    st.markdown(response_with_navigation, unsafe_allow_html=True)
+                # (the HTML path is only needed when the text actually cites something)
+                if message.get("citations") and "[Source " in message["content"]:
+                    st.markdown(get_formatted(message), unsafe_allow_html=True)
                 else:
                     st.write(message["content"])
                 
                 # Show expandable sources section with navigation
                 if message.get("citations"):
-                    with st.expander(f"📚 Sources ({len(message['citations'])} cited)", expanded=False):
-                        citations_to_display = message.get("citations", [])
-                        
-                        # Group citations by filename for better organization
-                        citations_by_file = {}
-                        for citation in citations_to_display:
-                            filename = citation.get('filename', 'Unknown')
-                            if filename not in citations_by_file:
-                                citations_by_file[filename] = []
-                            citations_by_file[filename].append(citation)
-                        
-                        for filename, file_citations in citations_by_file.items():
-                            if filename.endswith('.pdf'):
-                                st.markdown(f"**📄 {filename}**")
-                                
-                                # Create a button to open the document viewer with all citations
-                                viewer_url = create_document_viewer_url(filename, file_citations)
-                                st.markdown(f'<a href="{viewer_url}" target="_blank" style="text-decoration: none;"><button style="background: #2196f3; color: white; border: none; padding: 8px 16px; border-radius: 4px; cursor: pointer; margin-bottom: 10px;">🔍 Open Document Viewer</button></a>', unsafe_allow_html=True)
-                                
-                                # List the citations for this file
-                                for citation in file_citations:
-                                    col1, col2 = st.columns([4, 1])
-                                    with col1:
-                                        st.write(f"   • **[Source {citation['source_num']}]** Page {citation['page']}")
-                                    with col2:
-                                        # Button to open viewer focused on this specific citation
-                                        focused_url = create_document_viewer_url(filename, file_citations, citation['source_num'])
-                                        st.markdown(f'<a href="{focused_url}" target="_blank" style="text-decoration: none;"><button style="background: #ff9800; color: white; border: none; padding: 4px 8px; border-radius: 3px; cursor: pointer; font-size: 12px;">📍 Go to Source</button></a>', unsafe_allow_html=True)
-                                
-                                st.markdown("---")
-                            else:
-                                # Non-PDF files
-                                for citation in file_citations:
-                                    st.write(f"• **[Source {citation['source_num']}]** {citation['filename']}, p. {citation['page']}")
+                    render_sources(message["citations"])
 
 # Chat input
 if query := st.chat_input("Ask a question about your documents..."):
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": query})
+    user_message = {"role": "user", "content": query}
+    add_message(user_message)
+    st.session_state.user_count += 1
     
     # Display user message
     with st.chat_message("user"):
@@ -441,65 +655,41 @@ if query := st.chat_input("Ask a question about your documents..."):
     # Generate and display assistant response
     with st.chat_message("assistant"):
         with st.spinner("⏳ Thinking..."):
-            result = query_rag(query)
+            from query_data import query_rag_stream
+            response_stream, finalize = query_rag_stream(query)
+        
+        # Show the answer as it is generated (plain text, batched), then replace it
+        # with the citation-processed version once the stream is complete
+        response_placeholder = st.empty()
+        with response_placeholder.container():
+            streamed_text = st.write_stream(debounce_stream(response_stream))
+        result = finalize(streamed_text)
         
         # Store context for sidebar display
         st.session_state.last_context = result["context_used"]
         
+        # Build the history entry up front so the formatted HTML is computed once
+        # here and reused by every later rerun
+        assistant_message = {
+            "role": "assistant", 
+            "content": result["response_text"],
+            "citations": result["citations"],
+            "enhanced_citations": result.get("enhanced_citations", result["citations"])  # Store enhanced citations
+        }
+        
         # Display the response with clickable citations
-        if result["citations"]:
-            response_with_navigation = format_response_with_chunk_navigation(
-                result["response_text"], 
-                result["citations"]
-            )
-            st.markdown(response_with_navigation, unsafe_allow_html=True)
+        if result["citations"] and "[Source " in result["response_text"]:
+            response_placeholder.markdown(get_formatted(assistant_message), unsafe_allow_html=True)
         else:
-            st.write(result["response_text"])
+            response_placeholder.write(result["response_text"])
         
         # Show expandable sources section with navigation
         if result["citations"]:
-            with st.expander(f"📚 Sources ({len(result['citations'])} cited)", expanded=False):
-                citations_to_display = result["citations"]
-                
-                # Group citations by filename
-                citations_by_file = {}
-                for citation in citations_to_display:
-                    filename = citation.get('filename', 'Unknown')
-                    if filename not in citations_by_file:
-                        citations_by_file[filename] = []
-                    citations_by_file[filename].append(citation)
-                
-                for filename, file_citations in citations_by_file.items():
-                    if filename.endswith('.pdf'):
-                        st.markdown(f"**📄 {filename}**")
-                        
-                        # Create a button to open the document viewer with all citations
-                        viewer_url = create_document_viewer_url(filename, file_citations)
-                        st.markdown(f'<a href="{viewer_url}" target="_blank" style="text-decoration: none;"><button style="background: #2196f3; color: white; border: none; padding: 8px 16px; border-radius: 4px; cursor: pointer; margin-bottom: 10px;">🔍 Open Document Viewer</button></a>', unsafe_allow_html=True)
-                        
-                        # List the citations for this file
-                        for citation in file_citations:
-                            col1, col2 = st.columns([4, 1])
-                            with col1:
-                                st.write(f"   • **[Source {citation['source_num']}]** Page {citation['page']}")
-                            with col2:
-                                # Button to open viewer focused on this specific citation
-                                focused_url = create_document_viewer_url(filename, file_citations, citation['source_num'])
-                                st.markdown(f'<a href="{focused_url}" target="_blank" style="text-decoration: none;"><button style="background: #ff9800; color: white; border: none; padding: 4px 8px; border-radius: 3px; cursor: pointer; font-size: 12px;">📍 Go to Source</button></a>', unsafe_allow_html=True)
-                        
-                        st.markdown("---")
-                    else:
-                        # Non-PDF files
-                        for citation in file_citations:
-                            st.write(f"• **[Source {citation['source_num']}]** {citation['filename']}, p. {citation['page']}")
+            render_sources(result["citations"])
         
         # Add assistant message to chat history with enhanced citations
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": result["response_text"],
-            "citations": result["citations"],
-            "enhanced_citations": result.get("enhanced_citations", result["citations"])  # Store enhanced citations
-        })
+        add_message(assistant_message)
+        st.session_state.assistant_count += 1
 
 # Document Navigation Instructions
 if st.session_state.messages:
@@ -515,18 +705,24 @@ if st.session_state.messages:
     if has_pdf_citations:
         st.markdown("---")
 
-# # Show chat stats in sidebar
-# with st.sidebar:
-#     if st.session_state.messages:
-#         st.markdown("---")
-#         st.subheader("📊 Chat Stats")
-#         user_messages = len([m for m in st.session_state.messages if m["role"] == "user"])
-#         assistant_messages = len([m for m in st.session_state.messages if m["role"] == "assistant"])
-#         st.write(f"• **Questions asked:** {user_messages}")
-#         st.write(f"• **Responses given:** {assistant_messages}")
+# Show chat stats in sidebar
+with st.sidebar:
+    if st.session_state.messages:
+        st.markdown("---")
+        st.subheader("📊 Chat Stats")
+        user_messages = st.session_state.user_count
+        assistant_messages = st.session_state.assistant_count
+        st.write(f"• **Questions asked:** {user_messages}")
+        st.write(f"• **Responses given:** {assistant_messages}")
         
-#         # Show context option for last response
-#         if assistant_messages > 0:
-#             if st.checkbox("Show last context used"):
-#                 if 'last_context' in st.session_state:
-#                     st.text_area("Last Context", st.session_state.last_context, height=200, key="context_display", disabled=True)
+        # Show context option for last response
+        if assistant_messages > 0:
+            if st.checkbox("Show last context used"):
+                if 'last_context' in st.session_state:
+                    st.text_area("Last Context", st.session_state.last_context, height=200, key="context_display", disabled=True)
+
+# Nothing else reruns the script while the ingest thread works, so poll until the run
+# that finds it finished has shown the result (and re-enabled the ingest button)
+if ingest_running:
+    time.sleep(INGEST_POLL_INTERVAL)
+    st.rerun()